@@ -1,13 +1,20 @@
 from ib_insync import *
 import pandas as pd
+import argparse
+import glob
+import os
 
 from common.ReadConfigsIn import *
 from common.AdjustTimezone import *
+from common.Instrumentation import emit_run_metrics
 from database.DBfunctions import *
 from helpers.HandleDataFrames import *
-from helpers.ReadTlgFile import read_tlg_file  # from helpers folder
+from helpers.ReadTlgFile import read_tlg_file, read_tlg_files, iter_tlg_chunks  # from helpers folder
 from helpers.FetchIBdata import fetch_trade_data
-from helpers.HandleExecutions import handle_executions
+from helpers.FetchWorker import run_fetch_worker
+from helpers.RecomputeIndicators import recompute_indicators
+from helpers.HandleExecutions import handle_executions, move_tlg_file, store_executions
+from helpers.WatchTlgFolder import watch_tlg_folder
 
 
 
@@ -35,86 +42,196 @@ def get_uniquetickers_and_dates(df):
 
 
 
-def fetch_trades_by_pairs_loop(df_pairs, database_config):
-
-    all_trades = []
-
-    for _, row in df_pairs.iterrows():
-        symbol = row["Symbol"]
-        date = row["Date"]
-        trades_df = fetch_trades_by_symbol_and_date(symbol, date, database_config)
-        if not trades_df.empty:
-            all_trades.append(trades_df)
-
-    if all_trades:
-        return pd.concat(all_trades, ignore_index=True)
-    else:
-        return pd.DataFrame()  # Return empty DataFrame if no trades found
-
-
-
-
-
-
-
-
             
-def process_trades(executions_df: pd.DataFrame, project_config: dict, database_config: dict):
+def process_trades(executions_df: pd.DataFrame, project_config: dict, database_config: dict,
+                   account_info: dict | None = None, file_path: str | None = None):
     """
     Process trades from a DataFrame:
+    - Insert executions and move the .tlg file (when file_path is given)
     - Insert trades into DB
     - Fetch new trades that require market data
     - Fetch market data for them
     """
-    if executions_df.empty:
-        print("No transactions found in the file. Please check the file or provide a manual CSV.")
-        manual_file = project_config['folders']['manual']
-        executions_df = pd.read_csv(manual_file)
-        print("\nManual data entries:")
-        print(executions_df)
+    # One unit of work: all DB calls of this run share a pooled connection
+    with database_session(database_config):
+        if executions_df.empty:
+            print("No transactions found in the file. Please check the file or provide a manual CSV.")
+            manual_file = project_config['folders']['manual']
+            executions_df = pd.read_csv(manual_file)
+            print("\nManual data entries:")
+            print(executions_df)
+
+        else:
+            print("Account Information:")
+            print(account_info)
+            print("\nTransactions DataFrame:")
+            print(executions_df)
+            if file_path:
+                handle_executions(executions_df, file_path, project_config, database_config)
+
+        # Step 1: Get unique tickers and dates
+        df_uniquepairs_data = get_uniquetickers_and_dates(executions_df)
+
+        # Step 2 & 3: Insert trades to DB and fetch them back in one round-trip
+        trade_status = upsert_trades_to_db(df_uniquepairs_data, database_config)
+        print("\nTrade insert statuses:")
+        for _, status in trade_status.iterrows():
+            print(f"Symbol={status['Symbol']}, Date={status['Date']}, Status={status['Status']}")
+
+        my_trades = trade_status.drop(columns=["Status"], errors="ignore")
+
+        # Step 4: Filter trades that need market data (one coverage probe for the batch)
+        coverage = fetch_marketdata_coverage(
+            my_trades["TradeId"].tolist() if not my_trades.empty else [], database_config,
+            project_config.get('storage', {}).get('mode', 'per_trade')
+        )
+        new_trades = trades_missing_marketdata(my_trades, coverage)
+
+        # Step 5: Queue the missing timeframes as fetch jobs and drain the queue
+        queued = enqueue_fetch_jobs(coverage, database_config) if not new_trades.empty else 0
+        if queued is not None:
+            if not new_trades.empty:
+                print(f"Queued {queued} new fetch jobs for {len(new_trades)} trades.")
+            else:
+                print("No new trades to fetch market data for.")
+            # Also picks up jobs left failed or stale by earlier runs
+            run_fetch_worker(project_config, database_config)
+        else:
+            # No fetch_jobs table (not migrated): fetch directly, sessions still open are left for a later run
+            exchange_tz, _ = configured_timezones(project_config.get('timezones'))
+            closed = session_closed(new_trades["Date"], exchange_tz)
+            if not closed.all():
+                print(f"Deferring {int((~closed).sum())} trades until their session has closed.")
+            new_trades = new_trades[closed]
+            ensure_intraday_partitions(database_config, new_trades["Date"])
+            print("Starting fetch for the following trades:")
+            for _, row in new_trades.iterrows():
+                print(f"TradeId={row['TradeId']}, Symbol={row.get('Symbol', 'N/A')}, Date={row.get('Date', 'N/A')}")
+            fetch_trade_data(new_trades, project_config, database_config, coverage)
+
+
+
+
+def process_tlg_backlog(project_config: dict, database_config: dict, max_workers: int | None = None):
+    """
+    Batch ingest mode:
+    - Parse every .tlg file in the in folder concurrently
+    - Insert each file's executions and move it to out/error individually
+    - Process the merged, de-duplicated executions in one pass
+    """
+    account_info, executions_df, file_frames, failed_files = read_tlg_files(
+        project_config['folders']['in'], max_workers=max_workers
+    )
 
-    else:
-        print("Account Information:")
-        print(account_info)
-        print("\nTransactions DataFrame:")
-        print(executions_df)
-        handle_executions(executions_df, file_path, project_config, database_config)
-
-    # Step 1: Get unique tickers and dates
-    df_uniquepairs_data = get_uniquetickers_and_dates(executions_df)
-
-    # Step 2: Insert trades to DB
-    trade_status = insert_trades_to_db(df_uniquepairs_data, database_config)
-    print("\nTrade insert statuses:")
-    for status in trade_status:
-        print(f"Symbol={status['Symbol']}, Date={status['Date']}, Status={status['Status']}")
-
-    # Step 3: Fetch trades from DB
-    my_trades = fetch_trades_by_pairs_loop(df_uniquepairs_data, database_config)
-
-    # Step 4: Filter trades that need market data
-    new_trades = check_if_tradeid_has_marketdata(my_trades, database_config)
-
-    # Step 5: Fetch market data if needed
-    if not new_trades.empty:
-        print("Starting fetch for the following trades:")
-        for _, row in new_trades.iterrows():
-            print(f"TradeId={row['TradeId']}, Symbol={row.get('Symbol', 'N/A')}, Date={row.get('Date', 'N/A')}")
-        fetch_trade_data(new_trades, project_config, database_config)
-    else:
-        print("No new trades to fetch market data for.")
+    # Files that could not be parsed go straight to the error folder
+    for failed_file in failed_files:
+        filename = move_tlg_file(failed_file, project_config['folders']['error'])
+        print(f"Parsing failed. Moved {filename} to {project_config['folders']['error']}")
+
+    for file_path, file_df in file_frames:
+        print(f"\nHandling {len(file_df)} executions from {file_path}")
+        handle_executions(file_df, file_path, project_config, database_config)
+
+    if executions_df.empty and file_frames:
+        print("No transactions found in the .tlg files.")
+        return
+
+    process_trades(executions_df, project_config, database_config, account_info=account_info)
+
+
+def process_tlg_stream(project_config: dict, database_config: dict, chunksize: int = 50000):
+    """
+    Streaming mode for large multi-year logs:
+    - Parse the .tlg file in chunks of at most chunksize executions
+    - Insert and process each chunk before reading the next one
+    - Move the file to out when every chunk succeeded, to error otherwise
+    Re-running a failed file is safe: stored executions and trades are skipped.
+    """
+    data_in_folder = project_config['folders']['in']
+    file_paths = glob.glob(f"{data_in_folder}/*.tlg")
+    if not file_paths:
+        print(f"\nNo .tlg file found in {data_in_folder}.")
+        return
+
+    file_path = file_paths[0]  # Assumes exactly one .tlg file exists
+    chunks = 0
+    try:
+        for account_info, executions_df in iter_tlg_chunks(file_path, chunksize):
+            chunks += 1
+            print(f"\nChunk {chunks}: {len(executions_df)} executions from {os.path.basename(file_path)}")
+            store_executions(executions_df, database_config, project_config.get('timezones'))
+            process_trades(executions_df, project_config, database_config, account_info=account_info)
+    except Exception as e:
+        filename = move_tlg_file(file_path, project_config['folders']['error'])
+        print(f"Streaming failed in chunk {chunks}: {e}. Moved {filename} to {project_config['folders']['error']}")
+        return
 
+    if chunks == 0:
+        # Same fallback to manual entries as the whole-file mode
+        process_trades(pd.DataFrame(), project_config, database_config)
+        return
 
+    filename = move_tlg_file(file_path, project_config['folders']['out'])
+    print(f"Moved {filename} to {project_config['folders']['out']}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Handle trade data from IB .tlg files")
+    parser.add_argument("--batch", action="store_true",
+                        help="Process every .tlg file in the in folder instead of the first one")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of parser processes in batch mode (defaults to CPU count)")
+    parser.add_argument("--stream", type=int, nargs="?", const=50000, default=None, metavar="ROWS",
+                        help="Parse and process the .tlg file in chunks of ROWS executions (default 50000)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Run as a daemon that tails .tlg files in the in folder")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Apply pending schema migrations and create the current intraday partitions, then exit")
+    parser.add_argument("--worker", action="store_true",
+                        help="Drain the fetch job queue, then exit (several workers can run at once)")
+    parser.add_argument("--client-id", type=int, default=None,
+                        help="IB clientId of this worker (defaults to ib_connection.clientId)")
+    parser.add_argument("--recompute", nargs="*", choices=list(RECOMPUTE_TABLES), default=None,
+                        help="Recompute the indicators of stored market data (all timeframes when none given), then exit")
+    args = parser.parse_args()
+
     # Load configs
     project_config = read_project_config(config_file='config.json')
     database_config = read_database_config(filename="database.ini", section="postgresql")
 
-    # Read execution data
-    account_info, executions_df, file_path = read_tlg_file(project_config['folders']['in'])
+    if args.migrate:
+        migrate(database_config)
+        today = pd.Timestamp.today().normalize()
+        ensure_intraday_partitions(database_config, [today, today + pd.offsets.MonthBegin(1)])
+    elif args.recompute is not None:
+        with database_session(database_config):
+            recompute_indicators(project_config, database_config, timeframes=args.recompute or None)
+    elif args.worker:
+        with database_session(database_config):
+            run_fetch_worker(project_config, database_config, client_id=args.client_id)
+    elif args.watch:
+        def process_batch(executions_df, account_info):
+            process_trades(executions_df, project_config, database_config, account_info=account_info)
+            emit_run_metrics(project_config)
+
+        def drain_jobs():
+            # Fetches the jobs deferred while their session was open
+            if run_fetch_worker(project_config, database_config):
+                emit_run_metrics(project_config)
+
+        watch_tlg_folder(project_config, database_config, process_batch=process_batch, drain_jobs=drain_jobs)
+    elif args.batch:
+        process_tlg_backlog(project_config, database_config, max_workers=args.workers)
+    elif args.stream is not None:
+        process_tlg_stream(project_config, database_config, chunksize=args.stream)
+    else:
+        # Read execution data
+        account_info, executions_df, file_path = read_tlg_file(project_config['folders']['in'])
+
+        # Process trades
+        process_trades(executions_df, project_config, database_config,
+                       account_info=account_info, file_path=file_path)
 
-    # Process trades
-    process_trades(executions_df, project_config, database_config)
+    emit_run_metrics(project_config)
+    close_all_pools()
 
@@ -1,4 +1,11 @@
 from datetime import datetime, timedelta
+import re
+
+import numpy as np
+import pandas as pd
+
+
+_OFFSET_PATTERN = re.compile(r"([+-]\d{2}:?\d{2}|Z)$")
 
 
 # Function to adjust both 
@@ -29,4 +36,90 @@ def adjust_timezone_transactions(date_value):
     adjusted_date = (original_date + timedelta(hours=7)).strftime("%H:%M:%S")  # +7 - (-4) = 11
     
     # Return the adjusted date in the desired format
-    return adjusted_date
\ No newline at end of file
+    return adjusted_date
+
+
+# Vectorized, DST-aware conversion using real tz database zones.
+# Source is the exchange zone of IB data and tlg files, target is the local review zone.
+EXCHANGE_TIMEZONE = "US/Eastern"
+LOCAL_TIMEZONE = "Europe/Helsinki"
+
+
+# Bars of a trade date are final once the extended session has closed
+SESSION_CLOSE = pd.Timedelta(hours=20)
+
+
+def session_closed(dates, exchange_timezone=EXCHANGE_TIMEZONE, now=None):
+    """Boolean array: True where the trade date's extended session (until 20:00 exchange time) has ended."""
+    now = pd.Timestamp.now(tz=exchange_timezone) if now is None else now
+    last_closed = (now.tz_localize(None) - SESSION_CLOSE).normalize()
+    return (pd.to_datetime(pd.Series(dates).astype(str)) <= last_closed).to_numpy()
+
+
+def to_local_datetime(values, source_tz=EXCHANGE_TIMEZONE, local_tz=LOCAL_TIMEZONE):
+    """
+    Convert a whole column of timestamps to local_tz in one array operation.
+    Timezone-aware values (IB bars with offsets) keep their own offset,
+    naive values are interpreted in source_tz.
+    Returns a tz-aware datetime Series in local_tz.
+    """
+    values = pd.Series(values)
+    if values.empty:
+        return pd.Series(pd.DatetimeIndex([], tz=local_tz), index=values.index)
+
+    sample = values.iloc[0]
+    if getattr(sample, "tzinfo", None) is not None or (isinstance(sample, str) and _OFFSET_PATTERN.search(sample)):
+        # utc=True also handles mixed offsets across a DST change
+        converted = pd.to_datetime(values, utc=True)
+    else:
+        converted = pd.to_datetime(values).dt.tz_localize(
+            source_tz, ambiguous=True, nonexistent="shift_forward"
+        )
+
+    return converted.dt.tz_convert(local_tz)
+
+
+def configured_timezones(timezones=None):
+    """(exchange, local) zones from the timezones section of config.json, with the defaults."""
+    timezones = timezones or {}
+    return timezones.get('exchange', EXCHANGE_TIMEZONE), timezones.get('local', LOCAL_TIMEZONE)
+
+
+def _iso_strings(local):
+    """
+    "YYYY-MM-DDTHH:MM:SS" strings of tz-aware timestamps in their own zone.
+    numpy formats the whole array in C; .dt.strftime formats row by row.
+    """
+    naive = local.dt.tz_localize(None).to_numpy().astype("datetime64[s]")
+    return pd.Series(np.datetime_as_string(naive, unit='s'), index=local.index)
+
+
+def adjust_timezone_IB_series(dates, source_tz=EXCHANGE_TIMEZONE, local_tz=LOCAL_TIMEZONE):
+    """
+    Vectorized replacement for adjust_timezone_IB_data.
+    Returns local time strings in "%Y-%m-%d %H:%M" format.
+    """
+    strings = _iso_strings(to_local_datetime(dates, source_tz, local_tz))
+    return strings.str.slice(0, 16).str.replace("T", " ", regex=False)
+
+
+def adjust_timezone_transactions_frame(transactions_df, source_tz=EXCHANGE_TIMEZONE, local_tz=LOCAL_TIMEZONE):
+    """
+    Vectorized replacement for adjust_timezone_transactions.
+    Converts the Date (YYYYMMDD) and Time (HH:MM:SS) columns together so the
+    date rolls over when the local time crosses midnight.
+    Returns a copy with Date and Time in the same string formats.
+    """
+    df = transactions_df.copy()
+    if df.empty:
+        return df
+
+    naive = pd.to_datetime(
+        df['Date'].astype(str).str.replace("-", "") + " " + df['Time'].astype(str),
+        format="%Y%m%d %H:%M:%S"
+    )
+    strings = _iso_strings(to_local_datetime(naive, source_tz, local_tz))
+
+    df['Date'] = strings.str.slice(0, 10).str.replace("-", "", regex=False).to_numpy()
+    df['Time'] = strings.str.slice(11, 19).to_numpy()
+    return df
@@ -1,85 +1,151 @@
+import numpy as np
 import pandas as pd
 
+
+# Array kernels shared by the DataFrame functions below.
+# in = numpy arrays, out = numpy array aligned with the input
+# With `groups` (one key per value, e.g. TradeId) every group is an independent
+# series, so a long frame of many trades is computed in one grouped pass.
+
+def _grouped(values, groups):
+    return pd.Series(np.asarray(values, dtype=float)).groupby(np.asarray(groups), sort=False)
+
+
+def _ungroup(result):
+    """Grouped rolling/ewm results back in input order as an array."""
+    return result.droplevel(0).sort_index().to_numpy()
+
+
+def cumsum_skipna(values, groups=None):
+    """Cumulative sum that skips NaN like pandas' Series.cumsum."""
+    if groups is not None:
+        return _grouped(values, groups).cumsum().to_numpy()
+
+    values = np.asarray(values, dtype=float)
+    nan_mask = np.isnan(values)
+    result = np.nancumsum(values)
+    result[nan_mask] = np.nan
+    return result
+
+
+def vwap_kernel(open_, high, low, close, volume, groups=None):
+    """Cumulative OHLC4 VWAP, 0 where volume is still 0, rounded to 2 decimals."""
+    ohlc4 = (np.asarray(open_, dtype=float) + high + low + close) / 4
+    cumulative_vol = cumsum_skipna(volume, groups)
+    cumulative_pv = cumsum_skipna(ohlc4 * volume, groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = cumulative_pv / cumulative_vol
+    vwap[np.isnan(vwap)] = 0
+    return np.round(vwap, 2)
+
+
+def ema_kernel(values, period, groups=None):
+    """EMA with span=period and adjust=False (pandas' compiled ewm on a raw array)."""
+    if groups is not None:
+        return _ungroup(_grouped(values, groups).ewm(span=period, adjust=False).mean())
+    return pd.Series(np.asarray(values, dtype=float)).ewm(span=period, adjust=False).mean().to_numpy()
+
+
+def true_range_kernel(high, low, close, groups=None):
+    """True Range, falls back to High - Low where there is no previous close."""
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    if groups is not None:
+        prev_close = _grouped(close, groups).shift(1).to_numpy()
+    else:
+        prev_close = np.concatenate(([np.nan], np.asarray(close, dtype=float)[:-1]))
+
+    high_low = high - low
+    high_close = np.where(np.isnan(prev_close), high_low, np.abs(high - prev_close))
+    low_close = np.where(np.isnan(prev_close), high_low, np.abs(low - prev_close))
+    return np.maximum(np.maximum(high_low, high_close), low_close), prev_close
+
+
+def rolling_mean_kernel(values, period, groups=None):
+    """Rolling mean over `period` values, NaN until the window is full."""
+    if groups is not None:
+        return _ungroup(_grouped(values, groups).rolling(window=period).mean())
+    return pd.Series(np.asarray(values, dtype=float)).rolling(window=period).mean().to_numpy()
+
+
+def group_keys(data, by):
+    """Group key array of column `by`, None to treat the frame as one series."""
+    return data[by].to_numpy() if by is not None else None
+
+
+# The DataFrame functions take an optional `by` column (e.g. 'TradeId'):
+# each of its groups is calculated as its own series, in one pass.
+
 # in = df (Open, High, Low, Close, Volume)
 # out = df (Open, High, Low, Close, Volume, VWAP)
-def calculate_vwap(data):
-    data = data.copy()
-    data['OHLC4'] = (data['Open'] + data['High'] + data['Low'] + data['Close']) / 4
-    cumulative_vol = data['Volume'].cumsum()
-    cumulative_pv = (data['OHLC4'] * data['Volume']).cumsum()
-    data['VWAP'] = (cumulative_pv / cumulative_vol).fillna(0).round(2)
-    data.drop(columns=['OHLC4'], inplace=True)
-    return data
+def calculate_vwap(data, by=None):
+    vwap = vwap_kernel(
+        data['Open'].to_numpy(), data['High'].to_numpy(), data['Low'].to_numpy(),
+        data['Close'].to_numpy(), data['Volume'].to_numpy(), group_keys(data, by)
+    )
+    return data.assign(VWAP=vwap)
 
 
 # in = df (Open, High, Low, Close, Volume)
 # out = df (Open, High, Low, Close, Volume, EMA9)
-def calculate_ema(data, period):
+def calculate_ema(data, period, by=None):
 
     if 'Close' not in data.columns:
         raise ValueError("The DataFrame must contain a 'Close' column.")
 
     column_name = f'EMA{period}'
-    data[column_name] = data['Close'].ewm(span=period, adjust=False).mean().round(2)
+    data[column_name] = np.round(ema_kernel(data['Close'].to_numpy(), period, group_keys(data, by)), 2)
     return data
 
 # in = df (High, Low, Close)
 # out = df (High, Low, Close, Prev_Close, TR, ATR)
-def calculate_14day_atr(data, period=14):
+def calculate_14day_atr(data, period=14, by=None):
     """
     Calculate 14-day ATR for all rows and return a DataFrame with ATR column.
     Input: DataFrame with at least High, Low, Close columns.
     Output: DataFrame with Prev_Close, TR, and ATR columns added.
     """
-    df = data.copy()
-
-    # Previous close
-    df['Prev_Close'] = df['Close'].shift(1)
-
-    # True Range (TR)
-    df['TR'] = df.apply(
-        lambda row: max(
-            row['High'] - row['Low'],
-            abs(row['High'] - row['Prev_Close']) if pd.notnull(row['Prev_Close']) else row['High'] - row['Low'],
-            abs(row['Low'] - row['Prev_Close']) if pd.notnull(row['Prev_Close']) else row['High'] - row['Low']
-        ),
-        axis=1
+    # True Range (TR) and previous close
+    true_range, prev_close = true_range_kernel(
+        data['High'].to_numpy(), data['Low'].to_numpy(), data['Close'].to_numpy(), group_keys(data, by)
     )
 
     # ATR: exponential moving average of TR (rounded to 4 decimals)
-    df['ATR'] = df['TR'].ewm(span=period, adjust=False).mean().round(4)
+    return data.assign(
+        Prev_Close=prev_close,
+        TR=true_range,
+        ATR=np.round(ema_kernel(true_range, period, group_keys(data, by)), 4)
+    )
 
-    return df
+def calculate_rvol(data, period = 5, by=None):
 
-def calculate_rvol(data, period = 5):
+    volume = data['Volume'].to_numpy()
 
-    data = data.copy()
-    
     # Calculate 5-day average volume
-    data['5DayAvgVolume'] = data['Volume'].rolling(window=period).mean()
-    
+    average_volume = rolling_mean_kernel(volume, period, group_keys(data, by))
+
     # Calculate relative volume
-    data['RelativeVolume'] = data['Volume'] / data['5DayAvgVolume']
-    
-    return data
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_volume = volume / average_volume
+
+    return data.assign(**{'5DayAvgVolume': average_volume, 'RelativeVolume': relative_volume})
 
 # intraday data and daily atr data Relatr calculation will be done and column added
 def calculate_relatr(intraday_df, daily_atr_df):
     """
     Adds a Relatr column to intraday_df using the last ATR value from daily_atr_df.
-    
+    When both frames carry TradeId the last ATR is taken per trade, otherwise per symbol.
+
     intraday_df: DataFrame with columns ['Symbol', 'Close', 'VWAP', ...]
     daily_atr_df: DataFrame with columns ['Symbol', 'ATR', ...]
     """
-    intraday_df = intraday_df.copy()
-    
-    # Get last ATR value per symbol
-    last_atr = daily_atr_df.groupby('Symbol')['ATR'].last().to_dict()
-
-    # Compute Relatr for each row
-    intraday_df['Relatr'] = intraday_df.apply(
-        lambda row: round((row['VWAP'] - row['Close']) / last_atr.get(row['Symbol'], 1), 2),
-        axis=1
-    )
-    
-    return intraday_df
\ No newline at end of file
+    # Batches of several trades per symbol are matched by TradeId
+    key = 'TradeId' if 'TradeId' in intraday_df.columns and 'TradeId' in daily_atr_df.columns else 'Symbol'
+
+    # Get last ATR value per symbol (or per trade), 1 when missing
+    last_atr = daily_atr_df.groupby(key)['ATR'].last()
+    divisor = intraday_df[key].map(last_atr).fillna(1).to_numpy(dtype=float)
+
+    relatr = (intraday_df['VWAP'].to_numpy(dtype=float) - intraday_df['Close'].to_numpy(dtype=float)) / divisor
+
+    return intraday_df.assign(Relatr=np.round(relatr, 2))
@@ -0,0 +1,264 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.Calculate import ema_kernel, true_range_kernel, rolling_mean_kernel
+
+
+# Stateful counterparts of common/Calculate.py.
+# Each state advances with only the new bars and gives the same values as
+# recomputing the indicator over the full history.
+
+class EmaState:
+    """EMA (span=period, adjust=False) smoothing state."""
+
+    def __init__(self, period, last=None):
+        self.period = period
+        self.last = last
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return values
+        if self.last is None:
+            ema = ema_kernel(values, self.period)
+        else:
+            # Seeding the recursion with the previous EMA continues it exactly
+            ema = ema_kernel(np.concatenate(([self.last], values)), self.period)[1:]
+        self.last = float(ema[-1])
+        return ema
+
+    def to_dict(self):
+        return {"period": self.period, "last": self.last}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state["period"], state.get("last"))
+
+
+class VwapState:
+    """Cumulative OHLC4 * Volume and Volume sums of the current session."""
+
+    def __init__(self, session=None, cumulative_pv=0.0, cumulative_vol=0.0):
+        self.session = session
+        self.cumulative_pv = cumulative_pv
+        self.cumulative_vol = cumulative_vol
+
+    def update(self, open_, high, low, close, volume, sessions):
+        volume = np.asarray(volume, dtype=float)
+        if len(volume) == 0:
+            return volume
+        ohlc4 = (np.asarray(open_, dtype=float) + high + low + close) / 4
+        sessions = pd.Series(np.asarray(sessions).astype(str))
+
+        # Sums restart at every session change, the first session continues the state
+        pv = pd.Series(ohlc4 * volume).groupby(sessions.to_numpy()).cumsum().to_numpy()
+        vol = pd.Series(volume).groupby(sessions.to_numpy()).cumsum().to_numpy()
+        continues = (sessions == self.session).to_numpy()
+        pv = pv + np.where(continues, self.cumulative_pv, 0.0)
+        vol = vol + np.where(continues, self.cumulative_vol, 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = pv / vol
+        vwap[np.isnan(vwap)] = 0
+
+        self.session = sessions.iloc[-1]
+        self.cumulative_pv = float(np.nan_to_num(pv[-1]))
+        self.cumulative_vol = float(np.nan_to_num(vol[-1]))
+        return np.round(vwap, 2)
+
+    def to_dict(self):
+        return {"session": self.session, "cumulative_pv": self.cumulative_pv, "cumulative_vol": self.cumulative_vol}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state.get("session"), state.get("cumulative_pv", 0.0), state.get("cumulative_vol", 0.0))
+
+
+class AtrState:
+    """Previous close and unrounded ATR smoothing state."""
+
+    def __init__(self, period=14, prev_close=None, atr=None):
+        self.period = period
+        self.prev_close = prev_close
+        self.ema = EmaState(period, atr)
+
+    def update(self, high, low, close):
+        close = np.asarray(close, dtype=float)
+        if len(close) == 0:
+            return close, close, close
+        if self.prev_close is None:
+            true_range, prev_close = true_range_kernel(high, low, close)
+        else:
+            # Prepend the stored close so the first new bar gets a real True Range
+            true_range, prev_close = true_range_kernel(
+                np.concatenate(([np.nan], high)), np.concatenate(([np.nan], low)),
+                np.concatenate(([self.prev_close], close))
+            )
+            true_range, prev_close = true_range[1:], prev_close[1:]
+        atr = self.ema.update(true_range)
+        self.prev_close = float(close[-1])
+        return prev_close, true_range, np.round(atr, 4)
+
+    def to_dict(self):
+        return {"period": self.period, "prev_close": self.prev_close, "atr": self.ema.last}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state.get("period", 14), state.get("prev_close"), state.get("atr"))
+
+
+class RvolState:
+    """The last period - 1 volumes needed to continue the rolling average."""
+
+    def __init__(self, period=5, window=None):
+        self.period = period
+        self.window = list(window or [])
+
+    def update(self, volume):
+        volume = np.asarray(volume, dtype=float)
+        if len(volume) == 0:
+            return volume, volume
+        history = np.concatenate((np.asarray(self.window, dtype=float), volume))
+        average = rolling_mean_kernel(history, self.period)[len(self.window):]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = volume / average
+        self.window = history[-(self.period - 1):].tolist() if self.period > 1 else []
+        return average, relative
+
+    def to_dict(self):
+        return {"period": self.period, "window": self.window}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state.get("period", 5), state.get("window"))
+
+
+class IndicatorSet:
+    """
+    Indicators of one symbol and timeframe, advanced with only new bars.
+    Timeframes and the columns they add match HandleDataFrames:
+    - daily:    5DayAvgVolume, RelativeVolume
+    - 30mins:   EMA65
+    - intraday: VWAP, EMA9
+    - atr:      Prev_Close, TR, ATR
+    first_timestamp..last_timestamp is the continuous range of bars it has seen.
+    """
+
+    TIMEFRAMES = ("daily", "30mins", "intraday", "atr")
+
+    def __init__(self, timeframe, states=None, last_timestamp=None, first_timestamp=None):
+        if timeframe not in self.TIMEFRAMES:
+            raise ValueError(f"Unknown timeframe {timeframe}")
+        self.timeframe = timeframe
+        self.first_timestamp = first_timestamp
+        self.last_timestamp = last_timestamp
+        self.states = states or self._new_states(timeframe)
+
+    @staticmethod
+    def _new_states(timeframe):
+        if timeframe == "daily":
+            return {"rvol": RvolState(5)}
+        if timeframe == "30mins":
+            return {"ema65": EmaState(65)}
+        if timeframe == "intraday":
+            return {"vwap": VwapState(), "ema9": EmaState(9)}
+        return {"atr": AtrState(14)}
+
+    @staticmethod
+    def bar_timestamps(data):
+        """Bar timestamps from Date (and Time for intraday frames)."""
+        stamps = data['Date'].astype(str)
+        if 'Time' in data.columns:
+            stamps = stamps + " " + data['Time'].astype(str)
+        return pd.to_datetime(stamps)
+
+    def update(self, data):
+        """
+        Add indicator columns for bars newer than the last processed one.
+        Returns only the new bars; older or repeated bars are dropped.
+        """
+        timestamps = self.bar_timestamps(data)
+        if self.last_timestamp is not None:
+            new = (timestamps > pd.Timestamp(self.last_timestamp)).to_numpy()
+            data, timestamps = data[new], timestamps[new]
+        if data.empty:
+            return data
+
+        if self.timeframe == "daily":
+            average, relative = self.states["rvol"].update(data['Volume'].to_numpy())
+            data = data.assign(**{'5DayAvgVolume': average, 'RelativeVolume': relative})
+        elif self.timeframe == "30mins":
+            data = data.assign(EMA65=np.round(self.states["ema65"].update(data['Close'].to_numpy()), 2))
+        elif self.timeframe == "intraday":
+            vwap = self.states["vwap"].update(
+                data['Open'].to_numpy(), data['High'].to_numpy(), data['Low'].to_numpy(),
+                data['Close'].to_numpy(), data['Volume'].to_numpy(),
+                sessions=timestamps.dt.strftime("%Y-%m-%d").to_numpy()
+            )
+            ema9 = np.round(self.states["ema9"].update(data['Close'].to_numpy()), 2)
+            data = data.assign(VWAP=vwap, EMA9=ema9)
+        else:
+            prev_close, true_range, atr = self.states["atr"].update(
+                data['High'].to_numpy(), data['Low'].to_numpy(), data['Close'].to_numpy()
+            )
+            data = data.assign(Prev_Close=prev_close, TR=true_range, ATR=atr)
+
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamps.iloc[0].isoformat()
+        self.last_timestamp = timestamps.iloc[-1].isoformat()
+        return data
+
+    def to_dict(self):
+        return {
+            "timeframe": self.timeframe,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "states": {name: state.to_dict() for name, state in self.states.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, saved):
+        classes = {"rvol": RvolState, "ema65": EmaState, "ema9": EmaState, "vwap": VwapState, "atr": AtrState}
+        states = {name: classes[name].from_dict(state) for name, state in saved["states"].items()}
+        return cls(saved["timeframe"], states, saved.get("last_timestamp"), saved.get("first_timestamp"))
+
+
+class IndicatorStateStore:
+    """Persists one IndicatorSet per symbol and timeframe as JSON files."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, project_config):
+        """Build the store from the indicator_state section of config.json, None if disabled."""
+        state_config = project_config.get('indicator_state', {})
+        if not state_config.get('enabled', False):
+            return None
+        return cls(state_config['folder'])
+
+    def _path(self, symbol, timeframe):
+        return os.path.join(self.folder, f"{symbol}_{timeframe}.json")
+
+    def load(self, symbol, timeframe):
+        """Return the saved IndicatorSet or a fresh one."""
+        path = self._path(symbol, timeframe)
+        if not os.path.exists(path):
+            return IndicatorSet(timeframe)
+        try:
+            with open(path, 'r') as f:
+                return IndicatorSet.from_dict(json.load(f))
+        except Exception as e:
+            print(f"Indicator state {path} unreadable ({e}), starting fresh.")
+            return IndicatorSet(timeframe)
+
+    def save(self, symbol, indicator_set):
+        path = self._path(symbol, indicator_set.timeframe)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(indicator_set.to_dict(), f)
+        os.replace(tmp_path, path)
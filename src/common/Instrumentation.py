@@ -0,0 +1,202 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Per-stage wall time, row and request counters for a pipeline run.
+# Stages nest (a fetcher contains its inserts), so times of nested stages overlap.
+
+class StageStats:
+    """Counters of one stage, accumulated over all its calls."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.requests = 0
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 6),
+            "rows": self.rows,
+            "requests": self.requests,
+            "rows_per_second": round(self.rows / self.seconds, 2) if self.seconds else 0.0
+        }
+
+
+class StageTimer:
+    """Handle returned by stage(); add rows/requests while the stage runs."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.requests = 0
+
+
+class Metrics:
+    """Thread-safe registry of StageStats."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._active = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._active, "stack"):
+            self._active.stack = []
+        return self._active.stack
+
+    @contextmanager
+    def stage(self, name):
+        timer = StageTimer(name)
+        stack = self._stack()
+        stack.append(timer)
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield timer
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                stats = self._stages.setdefault(name, StageStats(name))
+                stats.calls += 1
+                stats.errors += int(failed)
+                stats.seconds += elapsed
+                stats.rows += timer.rows
+                stats.requests += timer.requests
+
+    def add_requests(self, count=1):
+        """Attribute IB requests to the innermost running stage of this thread."""
+        stack = self._stack()
+        if stack:
+            stack[-1].requests += count
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self.started = time.time()
+
+
+METRICS = Metrics()
+
+
+def stage(name):
+    """Context manager timing one stage: `with stage("name") as s: s.rows += n`."""
+    return METRICS.stage(name)
+
+
+def add_requests(count=1):
+    METRICS.add_requests(count)
+
+
+def count_rows(value):
+    """Row count of a DataFrame, list or similar, 0 for None."""
+    try:
+        return len(value) if value is not None else 0
+    except TypeError:
+        return 0
+
+
+def instrumented(name, rows=None):
+    """
+    Decorator timing every call of the function as stage `name`.
+    rows(result, *args, **kwargs) returns the processed row count;
+    by default it is the length of the first argument.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.stage(name) as timer:
+                result = func(*args, **kwargs)
+                try:
+                    if rows is not None:
+                        timer.rows += int(rows(result, *args, **kwargs))
+                    elif args:
+                        timer.rows += count_rows(args[0])
+                except Exception:
+                    pass
+                return result
+        return wrapper
+    return decorator
+
+
+def print_summary(metrics=METRICS):
+    snapshot = metrics.snapshot()
+    if not snapshot:
+        return
+    print("\nRun summary:")
+    print(f"{'stage':<45}{'calls':>7}{'seconds':>11}{'rows':>10}{'requests':>10}{'rows/s':>11}")
+    for name, stats in sorted(snapshot.items(), key=lambda item: -item[1]["seconds"]):
+        print(
+            f"{name:<45}{stats['calls']:>7}{stats['seconds']:>11.3f}{stats['rows']:>10}"
+            f"{stats['requests']:>10}{stats['rows_per_second']:>11.1f}"
+        )
+
+
+def _write_atomic(path, text):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_json(path, metrics=METRICS):
+    _write_atomic(path, json.dumps({
+        "started": metrics.started,
+        "finished": time.time(),
+        "stages": metrics.snapshot()
+    }, indent=2))
+
+
+def write_prometheus(path, metrics=METRICS, prefix="handletradedata"):
+    """Prometheus node_exporter textfile format."""
+    snapshot = metrics.snapshot()
+    series = [
+        ("stage_calls_total", "calls", "Calls of the pipeline stage"),
+        ("stage_errors_total", "errors", "Calls of the pipeline stage that raised"),
+        ("stage_seconds_total", "seconds", "Wall time spent in the pipeline stage"),
+        ("stage_rows_total", "rows", "Rows processed by the pipeline stage"),
+        ("stage_requests_total", "requests", "IB historical data requests sent by the pipeline stage"),
+    ]
+    lines = []
+    for metric, key, description in series:
+        lines.append(f"# HELP {prefix}_{metric} {description}")
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for name, stats in sorted(snapshot.items()):
+            lines.append(f'{prefix}_{metric}{{stage="{name}"}} {stats[key]}')
+    lines.append(f"# HELP {prefix}_last_run_timestamp_seconds Time the metrics were written")
+    lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+    lines.append(f"{prefix}_last_run_timestamp_seconds {time.time():.0f}")
+    _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def emit_run_metrics(project_config, metrics=METRICS):
+    """Print the run summary and write the files configured in the metrics section."""
+    print_summary(metrics)
+    metrics_config = project_config.get('metrics', {})
+    try:
+        if metrics_config.get('json'):
+            write_json(metrics_config['json'], metrics)
+        if metrics_config.get('prometheus'):
+            write_prometheus(metrics_config['prometheus'], metrics)
+    except Exception as e:
+        print(f"Could not write run metrics: {e}")
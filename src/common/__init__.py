@@ -1,4 +1,6 @@
 __all__ = [
     "AdjustTimezone",
     "Calculate",
+    "IndicatorState",
+    "Instrumentation",
     "ReadConfigsIn",]
\ No newline at end of file
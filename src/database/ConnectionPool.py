@@ -0,0 +1,169 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2 import pool, OperationalError, InterfaceError
+
+
+# Pool options may live in the same database.ini section as the connection parameters
+POOL_DEFAULTS = {
+    "pool_min": 1,
+    "pool_max": 5,
+    "pool_health_check_seconds": 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_owners = {}      # id(conn) -> pool the connection belongs to
+_last_used = {}   # id(conn) -> time the connection was last released
+_session = threading.local()
+
+
+def split_database_config(database_config):
+    """
+    Separate psycopg2 connection parameters from pool options.
+    Returns (connect_params, pool_options).
+    """
+    connect_params = {k: v for k, v in database_config.items() if k not in POOL_DEFAULTS}
+    pool_options = {k: type(default)(database_config.get(k, default)) for k, default in POOL_DEFAULTS.items()}
+    return connect_params, pool_options
+
+
+def get_pool(database_config):
+    """
+    Return the shared pool for this database config, creating it on first use.
+    """
+    connect_params, pool_options = split_database_config(database_config)
+    key = tuple(sorted(connect_params.items()))
+
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = pool.ThreadedConnectionPool(
+                pool_options["pool_min"],
+                pool_options["pool_max"],
+                **connect_params
+            )
+        return _pools[key], pool_options
+
+
+def _is_healthy(conn):
+    """Cheap round-trip to make sure the server side of the connection is alive."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except (OperationalError, InterfaceError):
+        return False
+
+
+def _checkout(database_config):
+    """
+    Take a connection from the pool, replacing it if it was dropped.
+    Connections idle longer than pool_health_check_seconds are probed first.
+    """
+    conn_pool, pool_options = get_pool(database_config)
+    conn = conn_pool.getconn()
+
+    idle = time.monotonic() - _last_used.get(id(conn), time.monotonic())
+    if conn.closed or (idle > pool_options["pool_health_check_seconds"] and not _is_healthy(conn)):
+        print("Database connection dropped, reconnecting...")
+        _last_used.pop(id(conn), None)
+        conn_pool.putconn(conn, close=True)
+        conn = conn_pool.getconn()
+
+    _owners[id(conn)] = conn_pool
+    return conn
+
+
+def acquire_connection(database_config):
+    """
+    Return a pooled connection.
+    Inside database_session() the session's connection is reused instead.
+    """
+    session_conn = getattr(_session, "conn", None)
+    if session_conn is not None:
+        if session_conn.closed:
+            conn_pool = _owners.pop(id(session_conn), None)
+            _last_used.pop(id(session_conn), None)
+            if conn_pool is not None:
+                conn_pool.putconn(session_conn, close=True)
+            _session.conn = _checkout(database_config)
+        return _session.conn
+
+    return _checkout(database_config)
+
+
+def release_connection(conn):
+    """
+    Return a connection to its pool.
+    The active session connection stays checked out; only its open transaction
+    is ended, like the pool does on putconn (every DBfunctions write commits
+    before releasing, so this ends reads and failed statements).
+    """
+    if conn is getattr(_session, "conn", None):
+        _end_transaction(conn)
+        return
+
+    conn_pool = _owners.pop(id(conn), None)
+    if conn_pool is None:
+        conn.close()
+        return
+
+    _last_used[id(conn)] = time.monotonic()
+    conn_pool.putconn(conn, close=bool(conn.closed))
+
+
+def _end_transaction(conn):
+    """Roll back whatever is open so the connection is not left idle or aborted in a transaction."""
+    if conn.closed:
+        return
+    try:
+        conn.rollback()
+    except (OperationalError, InterfaceError):
+        pass
+
+
+@contextmanager
+def database_session(database_config):
+    """
+    Every DBfunctions call inside the block reuses one connection.
+    Each call commits or rolls back its own transaction, so one failed
+    statement does not abort the calls after it.
+    Sessions are per thread and can be nested.
+    """
+    if getattr(_session, "conn", None) is not None:
+        yield _session.conn
+        return
+
+    _session.conn = _checkout(database_config)
+    try:
+        yield _session.conn
+    finally:
+        conn = _session.conn
+        _session.conn = None
+        _end_transaction(conn)
+        release_connection(conn)
+
+
+@contextmanager
+def dedicated_connection(database_config):
+    """
+    A pooled connection that bypasses the thread's session, e.g. for a
+    server-side cursor that must stay open while the session commits writes.
+    """
+    conn = _checkout(database_config)
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+def close_all_pools():
+    """Close every pooled connection, e.g. at the end of a run."""
+    with _pools_lock:
+        for conn_pool in _pools.values():
+            conn_pool.closeall()
+        _pools.clear()
+        _owners.clear()
+        _last_used.clear()
@@ -1,11 +1,23 @@
 import psycopg2
+from psycopg2.extras import execute_values
+import numpy as np
 import pandas as pd
+import io
+import threading
+from collections import OrderedDict
+
+from database.ConnectionPool import (
+    acquire_connection, release_connection, database_session, dedicated_connection, close_all_pools
+)
+from database.Schema import migrate, ensure_intraday_partitions
+from common.AdjustTimezone import EXCHANGE_TIMEZONE, LOCAL_TIMEZONE
+from common.Instrumentation import instrumented
 
 # Return connection and cursor
 def get_connection_and_cursor(database_config):
 
-    """Create and return a database connection and cursor."""
-    conn = psycopg2.connect(**database_config)
+    """Return a pooled database connection and cursor."""
+    conn = acquire_connection(database_config)
     if not conn:
         raise Exception("Failed to connect to database.")
     cur = conn.cursor()
@@ -15,6 +27,7 @@ def get_connection_and_cursor(database_config):
 
 
 
+@instrumented("insert_trades_to_db")
 def insert_trades_to_db(data, database_config):
 
     conn, cur = get_connection_and_cursor(database_config)
@@ -65,72 +78,152 @@ def insert_trades_to_db(data, database_config):
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
 
-def insert_executions_to_db(data, database_config):
-    
+@instrumented("upsert_trades_to_db")
+def upsert_trades_to_db(data, database_config):
+    """
+    Register all (Symbol, Date) pairs in one round-trip.
+    Inserts missing pairs and returns every pair's trade row with a Status column
+    ('Inserted' or 'Duplicate - Skipped'), replacing the insert-then-fetch loops.
+    """
     conn, cur = get_connection_and_cursor(database_config)
 
-    insert_query = """
-        INSERT INTO executions (
-            "Symbol", "Date", "Time", "PermId", "AvgPrice", "Shares", 
-            "Side", "Commission", "AdjustedAvgPrice"
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+    try:
+        if data.empty:
+            print("No trades to insert.")
+            return pd.DataFrame()
+
+        pairs = data[["Symbol", "Date"]].copy()
+        pairs["Date"] = pd.to_datetime(pairs["Date"]).dt.strftime('%Y-%m-%d')
+        pairs = pairs.drop_duplicates()
+
+        # Rows inserted by the CTE are not visible to the outer SELECT,
+        # so the join only finds pairs that existed before this statement
+        query = """
+            WITH input AS (
+                SELECT DISTINCT "Symbol", "Date"
+                FROM unnest(%s::text[], %s::date[]) AS i("Symbol", "Date")
+            ),
+            inserted AS (
+                INSERT INTO trades ("Symbol", "Date")
+                SELECT "Symbol", "Date" FROM input
+                ON CONFLICT ("Symbol", "Date") DO NOTHING
+                RETURNING *
+            )
+            SELECT inserted.*, 'Inserted' AS "Status"
+            FROM inserted
+            UNION ALL
+            SELECT t.*, 'Duplicate - Skipped' AS "Status"
+            FROM trades t
+            JOIN input i ON t."Symbol" = i."Symbol" AND t."Date" = i."Date"
+            ORDER BY "TradeId";
+        """
+        cur.execute(query, (pairs["Symbol"].astype(str).tolist(), pairs["Date"].tolist()))
+        rows = cur.fetchall()
+        colnames = [desc[0] for desc in cur.description]
+        conn.commit()
+
+        return pd.DataFrame(rows, columns=colnames)
+
+    except Exception as e:
+        print(f"Error upserting into trades table: {e}")
+        if conn:
+            conn.rollback()
+        return pd.DataFrame()
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+@instrumented("insert_executions_to_db")
+def insert_executions_to_db(data, database_config):
+    """
+    Bulk load executions:
+    - Stage the whole batch into a temp table with one COPY
+    - Insert with a single INSERT ... ON CONFLICT ("PermId") DO NOTHING RETURNING
+    - Print the per-PermId inserted/skipped report
+    Returns the list of inserted executions.
     """
+    conn, cur = get_connection_and_cursor(database_config)
+
+    columns = [
+        "Symbol", "Date", "Time", "PermId", "AvgPrice", "Shares",
+        "Side", "Commission", "AdjustedAvgPrice"
+    ]
+    column_list = ", ".join(f'"{col}"' for col in columns)
 
     inserted_info = []
     try:
-      
-
-        for _, row in data.iterrows():
-            perm_id = str(row["TransactionID"])
-            try:
-                # Check if PermId already exists
-                cur.execute('SELECT 1 FROM executions WHERE "PermId" = %s;', (perm_id,))
-                exists = cur.fetchone()
-                if exists:
-                    print(f"PermId {perm_id} already exists in the database. Skipping insert.")
-                    continue
-
-                date_str = str(row["Date"])  # YYYY-MM-DD
-                time_str = str(row["Time"])  # HH:MM:SS or full timestamp
-
-                values = (
-                    row["Ticker"],
-                    date_str,
-                    time_str,
-                    perm_id,
-                    float(row["Price"]),
-                    int(row["Quantity"]),
-                    row["Action"],
-                    float(row["Fee"]),
-                    float(row["Price"])  # Adjusted price fallback
-                )
-
-                cur.execute(insert_query, values)
-
-                inserted_info.append({
-                    "PermId": perm_id,
-                    "Ticker": row["Ticker"],
-                    "Date": date_str,
-                    "Time": time_str,
-                    "Quantity": row["Quantity"],
-                    "Price": row["Price"],
-                    "Action": row["Action"]
-                })
+        if data.empty:
+            print("No executions to insert.")
+            return inserted_info
+
+        # Step 1: Build the staging rows in executions column order
+        stage = pd.DataFrame({
+            "Symbol": data["Ticker"].astype(str),
+            "Date": data["Date"].astype(str),  # YYYYMMDD or YYYY-MM-DD
+            "Time": data["Time"].astype(str),  # HH:MM:SS
+            "PermId": data["TransactionID"].astype(str),
+            "AvgPrice": data["Price"].astype(float),
+            "Shares": data["Quantity"].astype(int),
+            "Side": data["Action"].astype(str),
+            "Commission": data["Fee"].astype(float),
+            "AdjustedAvgPrice": data["Price"].astype(float)  # Adjusted price fallback
+        })
 
-            except Exception as e:
-                print(f"Error inserting PermId {perm_id}: {e}")
-                conn.rollback()
+        buffer = io.StringIO()
+        stage.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        # Step 2: Stage the batch in one transfer
+        cur.execute(f"""
+            CREATE TEMP TABLE executions_stage ON COMMIT DROP AS
+            SELECT {column_list} FROM executions WITH NO DATA;
+        """)
+        cur.copy_expert(f"COPY executions_stage ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        # Step 3: Set-based insert, duplicates are skipped by the PermId constraint
+        cur.execute(f"""
+            INSERT INTO executions ({column_list})
+            SELECT DISTINCT ON ("PermId") {column_list}
+            FROM executions_stage
+            ORDER BY "PermId"
+            ON CONFLICT ("PermId") DO NOTHING
+            RETURNING "PermId";
+        """)
+        inserted_ids = {str(row[0]) for row in cur.fetchall()}
+        conn.commit()
+        invalidate_trade_bundles(symbols=stage.loc[stage["PermId"].isin(inserted_ids), "Symbol"].unique())
+
+        # Step 4: Report per PermId
+        for perm_id, ticker, date_str, time_str, quantity, price, action in zip(
+            stage["PermId"], data["Ticker"], stage["Date"], stage["Time"],
+            data["Quantity"], data["Price"], data["Action"]
+        ):
+            if perm_id not in inserted_ids:
+                print(f"PermId {perm_id} already exists in the database. Skipping insert.")
                 continue
 
-        conn.commit()
+            inserted_info.append({
+                "PermId": perm_id,
+                "Ticker": ticker,
+                "Date": date_str,
+                "Time": time_str,
+                "Quantity": quantity,
+                "Price": price,
+                "Action": action
+            })
+            inserted_ids.discard(perm_id)
 
         print("\nInserted Executions:")
         for info in inserted_info:
             print(info)
 
+        return inserted_info
+
     except Exception as e:
         print(f"Database error: {e}")
         if conn:
@@ -140,8 +233,9 @@ def insert_executions_to_db(data, database_config):
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
 
+@instrumented("insert_marketdata_to_db")
 def insert_marketdata_to_db(data, database_config):
 
     conn, cur = get_connection_and_cursor(database_config)
@@ -149,7 +243,7 @@ def insert_marketdata_to_db(data, database_config):
     try:
         if data.empty:
             print("No market data to insert.")
-            return
+            return True
 
         # Convert DataFrame to list of pure Python tuples
         values = [
@@ -173,24 +267,28 @@ def insert_marketdata_to_db(data, database_config):
                 "Symbol", "Date", "Open", "High", "Low", "Close", "Volume",
                 "5DayAvgVolume", "RelativeVolume", "TradeId"
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES %s
             ON CONFLICT ("Symbol", "Date", "TradeId") DO NOTHING;
         """
 
-        cur.executemany(insert_query, values)
+        execute_values(cur, insert_query, values, page_size=1000)
         conn.commit()
-        print(f"Inserting daily market data:  Symbol-Date: {data[['Symbol','Date']].drop_duplicates().iloc[0].to_dict()}")
+        invalidate_trade_bundles(trade_ids=data['TradeId'].unique())
+        print(f"Inserting daily market data: {len(values)} rows for {data['TradeId'].nunique()} trades")
+        return True
 
     except Exception as e:
         print(f"Error inserting market data: {e}")
         conn.rollback()
+        return False
 
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
     
+@instrumented("insert_marketdataintrad_to_db")
 def insert_marketdataintrad_to_db(data, database_config):
 
     conn, cur = get_connection_and_cursor(database_config)
@@ -198,7 +296,7 @@ def insert_marketdataintrad_to_db(data, database_config):
     try:
         if data.empty:
             print("No intraday market data to insert.")
-            return
+            return True
         # Ensure types are compatible with SQL (especially numpy types)
         data = data.astype({
             'Open': 'float',
@@ -217,38 +315,43 @@ def insert_marketdataintrad_to_db(data, database_config):
                 "Symbol", "Date", "Time", "Open", "High", "Low", "Close",
                 "Volume", "VWAP", "EMA9", "Relatr","TradeId"
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s)
+            VALUES %s
             ON CONFLICT ON CONSTRAINT unique_marketdataintrad DO NOTHING;
         """
 
-        # Prepare data rows
-        values = data[[
+        # Prepare data rows, missing indicators (Relatr without prior daily bars) as NULL
+        rows = data[[
             "Symbol", "Date", "Time", "Open", "High", "Low", "Close",
             "Volume", "VWAP", "EMA9", "Relatr" ,"TradeId"
-        ]].values.tolist()
+        ]]
+        values = rows.astype(object).where(pd.notnull(rows), None).values.tolist()
 
-        cur.executemany(insert_query, values)
+        execute_values(cur, insert_query, values, page_size=1000)
         conn.commit()
-        print(f"Inserting intraday market data: Symbol-Date: {data[['Symbol','Date']].drop_duplicates().iloc[0].to_dict()}")
+        invalidate_trade_bundles(trade_ids=data['TradeId'].unique())
+        print(f"Inserting intraday market data: {len(values)} rows for {data['TradeId'].nunique()} trades")
+        return True
 
     except Exception as e:
         print(f"Error inserting intraday market data: {e}")
         conn.rollback()
+        return False
 
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
 
+@instrumented("insert_marketdata30mins_to_db")
 def insert_marketdata30mins_to_db(data, database_config): 
 
     conn, cur = get_connection_and_cursor(database_config)
 
     try:
         if data.empty:
-            print("No intraday market data to insert.")
-            return
+            print("No 30mins market data to insert.")
+            return True
 
         # Ensure correct data types
         data = data.astype({
@@ -266,7 +369,7 @@ def insert_marketdata30mins_to_db(data, database_config):
                 "Symbol", "Date", "Open", "High", "Low", "Close",
                 "Volume", "EMA65","TradeId"
             )
-            VALUES (%s, %s, %s, %s, %s,  %s, %s, %s,%s)
+            VALUES %s
             ON CONFLICT ON CONSTRAINT unique_market30 DO NOTHING;
         """
 
@@ -275,19 +378,22 @@ def insert_marketdata30mins_to_db(data, database_config):
             "Volume", "EMA65","TradeId"
         ]].values.tolist()
 
-        cur.executemany(insert_query, values)
+        execute_values(cur, insert_query, values, page_size=1000)
         conn.commit()
-        print(f"Inserting 30mins market data: Symbol-Date: {data[['Symbol','Date']].drop_duplicates().iloc[0].to_dict()}")
+        invalidate_trade_bundles(trade_ids=data['TradeId'].unique())
+        print(f"Inserting 30mins market data: {len(values)} rows for {data['TradeId'].nunique()} trades")
+        return True
 
     except Exception as e:
-        print(f"Error inserting intraday market data: {e}")
+        print(f"Error inserting 30mins market data: {e}")
         conn.rollback()
+        return False
 
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
 
 
 
@@ -317,13 +423,14 @@ def fetch_all_executions(database_config):
 
     except Exception as e:
         print(f" Error fetching transactions: {e}")
+        conn.rollback()
         return pd.DataFrame()  # Return empty DataFrame on error
     
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
     
 def fetch_all_trades(database_config):
 
@@ -341,13 +448,14 @@ def fetch_all_trades(database_config):
         return pd.DataFrame(rows, columns=colnames)
     except Exception as e:
         print(f"Error fetching trades: {e}")
+        conn.rollback()
         return pd.DataFrame()  # Return empty DataFrame on failure
     
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
 
 def fetch_individual_trade(database_config, table_name: str, trade_id: int) -> bool:
     conn, cur = get_connection_and_cursor(database_config)
@@ -363,13 +471,14 @@ def fetch_individual_trade(database_config, table_name: str, trade_id: int) -> b
         return bool(row)
     except Exception as e:
         print(f" Error checking if TradeId {trade_id} exists in table {table_name}: {e}")
+        conn.rollback()
         return False
     
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
 
 
 
@@ -394,59 +503,715 @@ def fetch_trades_by_symbol_and_date(symbol, date, database_config):
 
     except Exception as e:
         print(f"Error fetching trades for Symbol={symbol}, Date={date}: {e}")
+        conn.rollback()
         return pd.DataFrame()  # Return empty DataFrame on failure
 
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
+
+
+
+# Trade review: bundles of all timeframes and executions per TradeId.
+# Bundles are kept in an in-process LRU cache, the insert functions invalidate it.
+TRADE_BUNDLE_CACHE_SIZE = 256
+_bundle_cache = OrderedDict()   # (storage_mode, exchange tz, local tz, TradeId) -> bundle dict
+_bundle_cache_lock = threading.Lock()
+
+# Bundle key -> (table or view, order by) per storage mode
+TRADE_BUNDLE_SOURCES = {
+    "per_trade": {
+        "daily": ("marketdatad", 'b."Date"'),
+        "30mins": ("marketdata30mins", 'b."Date"'),
+        "intraday": ("marketdataintrad", 'b."Date", b."Time"'),
+    },
+    "symbol": {
+        "daily": ("marketdatad_by_trade", 'b."Date"'),
+        "30mins": ("marketdata30mins_by_trade", 'b."Date"'),
+        "intraday": ("marketdataintrad_by_trade", 'b."Date", b."Time"'),
+    },
+}
+
+TEXT_COLUMNS = ("Symbol", "Date", "Time", "PermId", "Side")
+
+
+def invalidate_trade_bundles(trade_ids=None, symbols=None):
+    """Drop cached bundles of the given TradeIds and/or symbols (everything when both are None)."""
+    with _bundle_cache_lock:
+        if trade_ids is None and symbols is None:
+            _bundle_cache.clear()
+            return
+        trade_ids = {int(trade_id) for trade_id in (trade_ids if trade_ids is not None else [])}
+        symbols = {str(symbol) for symbol in (symbols if symbols is not None else [])}
+        for key in [key for key, bundle in _bundle_cache.items()
+                    if key[-1] in trade_ids or bundle["Symbol"] in symbols]:
+            del _bundle_cache[key]
+
+
+def copy_trade_bundle(bundle):
+    """Copy of a cached bundle, so callers can modify its frames without touching the cache."""
+    return {key: value.copy() if isinstance(value, pd.DataFrame) else value for key, value in bundle.items()}
+
 
+def json_rows_to_frame(rows):
+    """DataFrame from a json_agg array, numeric columns coerced (NaN arrives as a string)."""
+    df = pd.DataFrame(rows or [])
+    for col in df.columns:
+        if col not in TEXT_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
 
 
-def check_if_tradeid_has_marketdata(my_trades, database_config):
+def fetch_trade_bundle(trade_ids, database_config, storage_mode="per_trade",
+                       exchange_timezone=EXCHANGE_TIMEZONE, local_timezone=LOCAL_TIMEZONE):
+    """
+    Daily, 30-min and intraday bars plus executions for one or many trades.
+    Trades missing from the cache are loaded in a single round-trip.
+    Executions are stored in local time, they are matched to the trade by
+    Symbol and their date converted back to exchange time.
+    Bundles are cached per storage mode and timezones; the caller gets copies.
+    Returns {TradeId: {"Symbol", "Date", "daily", "30mins", "intraday", "executions"}}.
+    """
+    if isinstance(trade_ids, (int, np.integer)):
+        trade_ids = [trade_ids]
+    trade_ids = list(dict.fromkeys(int(trade_id) for trade_id in trade_ids))
+    cache_key = lambda trade_id: (storage_mode, exchange_timezone, local_timezone, trade_id)
+
+    bundles = {}
+    with _bundle_cache_lock:
+        for trade_id in trade_ids:
+            key = cache_key(trade_id)
+            if key in _bundle_cache:
+                _bundle_cache.move_to_end(key)
+                bundles[trade_id] = _bundle_cache[key]
+    missing = [trade_id for trade_id in trade_ids if trade_id not in bundles]
+    query_failed = False
+
+    if missing:
+        sources = TRADE_BUNDLE_SOURCES[storage_mode]
+        timeframe_columns = ",\n                ".join(
+            f'''(SELECT COALESCE(json_agg(b ORDER BY {order_by}), '[]'::json)
+                 FROM {table} b WHERE b."TradeId" = t."TradeId") AS "{key}"'''
+            for key, (table, order_by) in sources.items()
+        )
+        query = f'''
+            SELECT
+                t."TradeId", t."Symbol", t."Date",
+                {timeframe_columns},
+                (SELECT COALESCE(json_agg(e ORDER BY e."Date", e."Time"), '[]'::json)
+                 FROM executions e
+                 WHERE e."Symbol" = t."Symbol"
+                   AND ((e."Date" + e."Time") AT TIME ZONE %(local)s AT TIME ZONE %(exchange)s)::date = t."Date"
+                ) AS "executions"
+            FROM trades t
+            WHERE t."TradeId" = ANY(%(trade_ids)s::int[])
+            ORDER BY t."TradeId";
+        '''
+
+        conn, cur = get_connection_and_cursor(database_config)
+        try:
+            cur.execute(query, {"trade_ids": missing, "local": local_timezone, "exchange": exchange_timezone})
+            rows = cur.fetchall()
+        except Exception as e:
+            print(f"Error fetching trade bundles for TradeIds {missing}: {e}")
+            conn.rollback()
+            rows = []
+            query_failed = True
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                release_connection(conn)
+
+        with _bundle_cache_lock:
+            for trade_id, symbol, date, daily, midterm, intraday, executions in rows:
+                bundle = {
+                    "Symbol": symbol,
+                    "Date": date,
+                    "daily": json_rows_to_frame(daily),
+                    "30mins": json_rows_to_frame(midterm),
+                    "intraday": json_rows_to_frame(intraday),
+                    "executions": json_rows_to_frame(executions),
+                }
+                bundles[trade_id] = bundle
+                _bundle_cache[cache_key(trade_id)] = bundle
+                _bundle_cache.move_to_end(cache_key(trade_id))
+            while len(_bundle_cache) > TRADE_BUNDLE_CACHE_SIZE:
+                _bundle_cache.popitem(last=False)
+
+    if not query_failed:
+        for trade_id in trade_ids:
+            if trade_id not in bundles:
+                print(f"TradeId {trade_id} not found.")
+    return {trade_id: copy_trade_bundle(bundles[trade_id]) for trade_id in trade_ids if trade_id in bundles}
+
+
+
+# Coverage matrix column -> market data table
+MARKETDATA_TIMEFRAMES = {
+    "daily": "marketdatad",
+    "30mins": "marketdata30mins",
+    "intraday": "marketdataintrad",
+}
+
+
+def fetch_marketdata_coverage(trade_ids, database_config, storage_mode="per_trade"):
     """
-    Remove trades that already exist in any of the 3 tables (by TradeId).
-    Returns a DataFrame with only new trades.
+    One probe for the whole batch: returns a TradeId x timeframe coverage matrix
+    with boolean columns daily, 30mins and intraday.
+    In symbol storage mode coverage comes from trade_bar_windows.
+    On error every timeframe is reported missing so the fetch stage repairs it.
+    """
+    trade_ids = [int(trade_id) for trade_id in trade_ids]
+    columns = ["TradeId", *MARKETDATA_TIMEFRAMES]
+    if not trade_ids:
+        return pd.DataFrame(columns=columns)
+
+    conn, cur = get_connection_and_cursor(database_config)
+
+    try:
+        query = '''
+            SELECT
+                t."TradeId",
+                EXISTS (SELECT 1 FROM marketdatad d WHERE d."TradeId" = t."TradeId") AS "daily",
+                EXISTS (SELECT 1 FROM marketdata30mins m WHERE m."TradeId" = t."TradeId") AS "30mins",
+                EXISTS (SELECT 1 FROM marketdataintrad i WHERE i."TradeId" = t."TradeId") AS "intraday"
+            FROM unnest(%s::int[]) AS t("TradeId")
+            ORDER BY t."TradeId";
+        '''
+        if storage_mode == "symbol":
+            query = '''
+                SELECT
+                    t."TradeId",
+                    EXISTS (SELECT 1 FROM trade_bar_windows w
+                            WHERE w."TradeId" = t."TradeId" AND w."Timeframe" = 'daily') AS "daily",
+                    EXISTS (SELECT 1 FROM trade_bar_windows w
+                            WHERE w."TradeId" = t."TradeId" AND w."Timeframe" = '30mins') AS "30mins",
+                    EXISTS (SELECT 1 FROM trade_bar_windows w
+                            WHERE w."TradeId" = t."TradeId" AND w."Timeframe" = 'intraday') AS "intraday"
+                FROM unnest(%s::int[]) AS t("TradeId")
+                ORDER BY t."TradeId";
+            '''
+
+        cur.execute(query, (trade_ids,))
+        rows = cur.fetchall()
+        return pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
+
+    except Exception as e:
+        print(f"Error fetching market data coverage: {e}")
+        conn.rollback()
+        return pd.DataFrame(
+            [[trade_id, *(False for _ in MARKETDATA_TIMEFRAMES)] for trade_id in trade_ids],
+            columns=columns
+        )
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+def trades_missing_marketdata(my_trades, coverage, timeframe=None):
+    """
+    Select trades that miss market data for the given timeframe
+    (or for any timeframe when timeframe is None).
+    """
+    if my_trades.empty:
+        return my_trades
+
+    timeframes = [timeframe] if timeframe else list(MARKETDATA_TIMEFRAMES)
+    covered = my_trades[["TradeId"]].merge(coverage, on="TradeId", how="left")
+    covered = covered[timeframes].fillna(False).astype(bool)
+
+    missing = ~covered.all(axis=1).to_numpy()
+    return my_trades[missing]
+
+
+def check_if_tradeid_has_marketdata(my_trades, database_config, storage_mode="per_trade"):
+    """
+    Remove trades that already have market data in all 3 tables (by TradeId).
+    Returns a DataFrame with trades that still miss at least one timeframe.
     """
     if my_trades.empty:
         return my_trades
 
+    coverage = fetch_marketdata_coverage(my_trades["TradeId"].tolist(), database_config, storage_mode)
+    return trades_missing_marketdata(my_trades, coverage)
+
+
+
+# Durable fetch job queue (fetch_jobs table, schema migration 4)
+
+def enqueue_fetch_jobs(coverage, database_config):
+    """
+    Create a pending job for every (TradeId, timeframe) missing in the coverage matrix.
+    Pending and running jobs are left alone. Done jobs whose data is missing again and
+    failed jobs (including ones out of attempts) are reopened with a fresh attempt budget,
+    so every run retries what earlier runs could not fetch.
+    Returns the number of new or reopened jobs, None when the queue is unavailable.
+    """
+    if coverage.empty:
+        return 0
+
+    missing = coverage.melt(id_vars="TradeId", value_vars=list(MARKETDATA_TIMEFRAMES),
+                            var_name="Timeframe", value_name="Covered")
+    missing = missing[~missing["Covered"].astype(bool)]
+    if missing.empty:
+        return 0
+
+    conn, cur = get_connection_and_cursor(database_config)
+    try:
+        cur.execute('''
+            INSERT INTO fetch_jobs ("TradeId", "Timeframe")
+            SELECT * FROM unnest(%s::int[], %s::text[])
+            ON CONFLICT ("TradeId", "Timeframe") DO UPDATE
+                SET "Status" = 'pending', "Attempts" = 0, "UpdatedAt" = now()
+                WHERE fetch_jobs."Status" IN ('done', 'failed')
+            RETURNING "TradeId";
+        ''', (missing["TradeId"].astype(int).tolist(), missing["Timeframe"].tolist()))
+        created = len(cur.fetchall())
+        conn.commit()
+        print(f"Fetch jobs: {created} queued, {len(missing) - created} already open")
+        return created
+
+    except Exception as e:
+        print(f"Error enqueuing fetch jobs: {e}")
+        conn.rollback()
+        return None
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+def claim_fetch_jobs(database_config, worker, limit=50, max_attempts=3, stale_seconds=3600,
+                     exchange_timezone=EXCHANGE_TIMEZONE):
+    """
+    Claim up to `limit` open jobs for this worker in one statement:
+    pending jobs, failed jobs with attempts left and running jobs whose worker
+    went silent for stale_seconds. Locked rows are skipped, so concurrent
+    workers never claim the same job. Jobs are ordered by symbol and date so
+    a claim keeps a symbol's trades together.
+    Trades whose session has not closed yet (20:00 exchange time) stay queued:
+    their bars are still incomplete and stored bars are never replaced.
+    Returns a DataFrame of TradeId, Timeframe, Symbol, Date, Attempts.
+    """
+    columns = ["TradeId", "Timeframe", "Symbol", "Date", "Attempts"]
     conn, cur = get_connection_and_cursor(database_config)
+    try:
+        cur.execute('''
+            WITH claimable AS (
+                SELECT j."TradeId", j."Timeframe"
+                FROM fetch_jobs j
+                JOIN trades t ON t."TradeId" = j."TradeId"
+                WHERE (j."Status" = 'pending'
+                       OR (j."Status" = 'failed' AND j."Attempts" < %(max_attempts)s)
+                       OR (j."Status" = 'running' AND j."ClaimedAt" < now() - %(stale_seconds)s * interval '1 second'))
+                  AND t."Date" <= ((now() AT TIME ZONE %(exchange)s) - interval '20 hours')::date
+                ORDER BY t."Symbol", t."Date", j."TradeId", j."Timeframe"
+                LIMIT %(limit)s
+                FOR UPDATE OF j SKIP LOCKED
+            ),
+            claimed AS (
+                UPDATE fetch_jobs j
+                SET "Status" = 'running',
+                    "Attempts" = j."Attempts" + 1,
+                    "Worker" = %(worker)s,
+                    "ClaimedAt" = now(),
+                    "UpdatedAt" = now()
+                FROM claimable c
+                WHERE j."TradeId" = c."TradeId" AND j."Timeframe" = c."Timeframe"
+                RETURNING j."TradeId", j."Timeframe", j."Attempts"
+            )
+            SELECT c."TradeId", c."Timeframe", t."Symbol", t."Date", c."Attempts"
+            FROM claimed c
+            JOIN trades t ON t."TradeId" = c."TradeId"
+            ORDER BY t."Symbol", t."Date", c."TradeId";
+        ''', {"max_attempts": max_attempts, "stale_seconds": stale_seconds, "limit": limit, "worker": worker,
+              "exchange": exchange_timezone})
+        rows = cur.fetchall()
+        conn.commit()
+        return pd.DataFrame(rows, columns=columns)
 
+    except Exception as e:
+        print(f"Error claiming fetch jobs: {e}")
+        conn.rollback()
+        return pd.DataFrame(columns=columns)
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+def finish_fetch_jobs(jobs, coverage, database_config, error=None):
+    """
+    Close claimed jobs against the coverage matrix after the fetch:
+    covered timeframes become done, the rest failed with `error` (or a default reason).
+    Returns the number of jobs done.
+    """
+    if jobs.empty:
+        return 0
+
+    covered = jobs[["TradeId", "Timeframe"]].merge(
+        coverage.melt(id_vars="TradeId", value_vars=list(MARKETDATA_TIMEFRAMES),
+                      var_name="Timeframe", value_name="Covered"),
+        on=["TradeId", "Timeframe"], how="left"
+    )
+    covered["Covered"] = covered["Covered"].fillna(False).astype(bool)
+    status = covered["Covered"].map({True: "done", False: "failed"})
+    last_error = [None if is_covered else (error or "No market data stored") for is_covered in covered["Covered"]]
+
+    conn, cur = get_connection_and_cursor(database_config)
     try:
-        trade_ids = tuple(my_trades["TradeId"].tolist())
-        if len(trade_ids) == 1:  # psycopg2 requires (id,) not (id)
-            trade_ids = (trade_ids[0],)
+        cur.execute('''
+            UPDATE fetch_jobs j
+            SET "Status" = u."Status", "LastError" = u."LastError", "UpdatedAt" = now()
+            FROM unnest(%s::int[], %s::text[], %s::text[], %s::text[])
+                 AS u("TradeId", "Timeframe", "Status", "LastError")
+            WHERE j."TradeId" = u."TradeId" AND j."Timeframe" = u."Timeframe";
+        ''', (
+            covered["TradeId"].astype(int).tolist(), covered["Timeframe"].tolist(),
+            status.tolist(), last_error
+        ))
+        conn.commit()
+        done = int((status == "done").sum())
+        print(f"Fetch jobs: {done} done, {len(status) - done} failed")
+        return done
 
-        query = '''
-            SELECT "TradeId" 
-            FROM marketdatad
-            WHERE "TradeId" IN %s
-            UNION
-            SELECT "TradeId" 
-            FROM marketdataintrad
-            WHERE "TradeId" IN %s
-            UNION
-            SELECT "TradeId" 
-            FROM marketdata30mins
-            WHERE "TradeId" IN %s;
-        '''
+    except Exception as e:
+        print(f"Error finishing fetch jobs: {e}")
+        conn.rollback()
+        return 0
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+# Indicator recomputation (per_trade storage mode): stored bars are streamed back,
+# the indicators recomputed and only the indicator columns rewritten.
+
+RECOMPUTE_TABLES = {
+    # timeframe: (table, bar columns, key columns, indicator columns)
+    "daily": (
+        "marketdatad",
+        ["Symbol", "Date", "Open", "High", "Low", "Close", "Volume"],
+        ["Symbol", "Date", "TradeId"],
+        ["5DayAvgVolume", "RelativeVolume"]
+    ),
+    "30mins": (
+        "marketdata30mins",
+        ["Symbol", "Date", "Open", "High", "Low", "Close", "Volume"],
+        ["Symbol", "Date", "TradeId"],
+        ["EMA65"]
+    ),
+    "intraday": (
+        "marketdataintrad",
+        ["Symbol", "Date", "Time", "Open", "High", "Low", "Close", "Volume"],
+        ["Symbol", "Date", "Time", "TradeId"],
+        ["VWAP", "EMA9", "Relatr"]
+    ),
+}
+
+
+def stream_marketdata(timeframe, database_config, trade_ids=None, chunk_trades=500, fetch_size=50000):
+    """
+    Yield the stored bars of a timeframe as DataFrames of whole trades
+    (at least chunk_trades TradeIds each, the last chunk may be smaller),
+    ordered by TradeId and bar time.
+    Rows come from a server-side cursor on a dedicated connection, so the table
+    is never loaded at once and writes between chunks can commit.
+    """
+    table, bar_columns, key_columns, indicator_columns = RECOMPUTE_TABLES[timeframe]
+    columns = bar_columns + indicator_columns + ["TradeId"]
+    column_list = ", ".join(f'"{col}"' for col in columns)
+    order = ", ".join(f'"{col}"' for col in ["TradeId"] + [c for c in key_columns if c in ("Date", "Time")])
+    where = 'WHERE "TradeId" = ANY(%s)' if trade_ids is not None else ""
+    params = ([int(trade_id) for trade_id in trade_ids],) if trade_ids is not None else None
+
+    with dedicated_connection(database_config) as conn:
+        cur = conn.cursor(name=f"stream_{table}")
+        cur.itersize = fetch_size
+        try:
+            cur.execute(f"SELECT {column_list} FROM {table} {where} ORDER BY {order};", params)
+
+            carry = pd.DataFrame(columns=columns)
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                frame = pd.DataFrame(rows, columns=columns)
+                if not carry.empty:
+                    frame = pd.concat([carry, frame], ignore_index=True)
+
+                # The last TradeId may continue in the next fetch
+                if frame["TradeId"].nunique() <= chunk_trades:
+                    carry = frame
+                    continue
+                complete = (frame["TradeId"] != frame["TradeId"].iloc[-1]).to_numpy()
+                carry = frame[~complete].reset_index(drop=True)
+                yield frame[complete].reset_index(drop=True)
+
+            if not carry.empty:
+                yield carry
+
+        except Exception as e:
+            # A partial stream must not look like a complete one
+            print(f"Error streaming {table}: {e}")
+            raise
 
-        cur.execute(query, (trade_ids, trade_ids, trade_ids))
-        existing_ids = [row[0] for row in cur.fetchall()]
+        finally:
+            cur.close()
 
-        # Keep only trades that are NOT already in DB
-        new_trades = my_trades[~my_trades["TradeId"].isin(existing_ids)]
 
-        return new_trades
+def fetch_prior_daily_bars(trade_ids, database_config, period=14):
+    """
+    The last `period` stored daily bars before each trade's date,
+    the input of the ATR used for Relatr.
+    """
+    columns = ["Symbol", "Date", "Open", "High", "Low", "Close", "Volume", "TradeId"]
+    conn, cur = get_connection_and_cursor(database_config)
+    try:
+        cur.execute('''
+            SELECT d."Symbol", d."Date", d."Open", d."High", d."Low", d."Close", d."Volume", d."TradeId"
+            FROM trades t
+            CROSS JOIN LATERAL (
+                SELECT * FROM marketdatad m
+                WHERE m."TradeId" = t."TradeId" AND m."Date" < t."Date"
+                ORDER BY m."Date" DESC
+                LIMIT %s
+            ) d
+            WHERE t."TradeId" = ANY(%s)
+            ORDER BY d."TradeId", d."Date";
+        ''', (period, [int(trade_id) for trade_id in trade_ids]))
+        return pd.DataFrame(cur.fetchall(), columns=columns)
 
     except Exception as e:
-        print(f"Error filtering new trades: {e}")
-        return my_trades  # fallback: return everything
+        print(f"Error fetching prior daily bars: {e}")
+        conn.rollback()
+        return pd.DataFrame(columns=columns)
 
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_connection(conn)
+
+
+@instrumented("update_indicator_columns")
+def update_indicator_columns(data, timeframe, database_config):
+    """
+    Bulk rewrite of the indicator columns of stored bars:
+    - Stage keys and new values into a temp table with one COPY
+    - One UPDATE ... FROM joined on the table's unique key
+    Returns the number of updated rows.
+    """
+    if data is None or data.empty:
+        return 0
+
+    table, _, key_columns, indicator_columns = RECOMPUTE_TABLES[timeframe]
+    columns = key_columns + indicator_columns
+    column_list = ", ".join(f'"{col}"' for col in columns)
+    assignments = ", ".join(f'"{col}" = s."{col}"' for col in indicator_columns)
+    match = " AND ".join(f't."{col}" = s."{col}"' for col in key_columns)
+
+    conn, cur = get_connection_and_cursor(database_config)
+    try:
+        buffer = io.StringIO()
+        data[columns].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        cur.execute(f"""
+            CREATE TEMP TABLE {table}_recompute ON COMMIT DROP AS
+            SELECT {column_list} FROM {table} WITH NO DATA;
+        """)
+        cur.copy_expert(f"COPY {table}_recompute ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute(f"UPDATE {table} t SET {assignments} FROM {table}_recompute s WHERE {match};")
+        updated = cur.rowcount
+        conn.commit()
+        invalidate_trade_bundles(trade_ids=data['TradeId'].unique())
+        return updated
+
+    except Exception as e:
+        print(f"Error updating {timeframe} indicators: {e}")
+        conn.rollback()
+        raise
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+# Symbol-level storage mode: bars are stored once per (Symbol, bar size, timestamp)
+# and trades reference a window over them. The *_by_trade views reproduce the
+# per-TradeId marketdatad / marketdata30mins / marketdataintrad tables.
+
+SYMBOL_BAR_TABLES = {
+    # timeframe: (table, columns, key columns, indicator columns)
+    "daily": (
+        "bars_daily",
+        ["Symbol", "Date", "Open", "High", "Low", "Close", "Volume", "5DayAvgVolume", "RelativeVolume"],
+        ["Symbol", "Date"],
+        ["5DayAvgVolume", "RelativeVolume"]
+    ),
+    "30mins": (
+        "bars_30mins",
+        ["Symbol", "Date", "Open", "High", "Low", "Close", "Volume", "EMA65"],
+        ["Symbol", "Date"],
+        ["EMA65"]
+    ),
+    "intraday": (
+        "bars_intraday",
+        ["Symbol", "Date", "Time", "Open", "High", "Low", "Close", "Volume", "VWAP", "EMA9", "Relatr"],
+        ["Symbol", "Date", "Time"],
+        ["VWAP", "EMA9", "Relatr"]
+    ),
+}
+
+
+def trade_windows(data, timeframe):
+    """Start/End timestamp of each TradeId's bars in a handler output frame."""
+    stamps = data['Date'].astype(str)
+    if timeframe == "intraday":
+        stamps = stamps + " " + data['Time'].astype(str)
+    stamps = pd.to_datetime(stamps)
+
+    windows = data[['TradeId', 'Symbol']].assign(Stamp=stamps).groupby('TradeId').agg(
+        Symbol=('Symbol', 'first'), Start=('Stamp', 'min'), End=('Stamp', 'max')
+    ).reset_index()
+    return windows
+
+
+def upsert_trade_windows(cur, windows, timeframe):
+    """Record TradeId windows (TradeId, Symbol, Start, End); existing windows only grow."""
+    execute_values(cur, """
+        INSERT INTO trade_bar_windows ("TradeId", "Timeframe", "Symbol", "Start", "End")
+        VALUES %s
+        ON CONFLICT ("TradeId", "Timeframe") DO UPDATE
+        SET "Start" = LEAST(trade_bar_windows."Start", EXCLUDED."Start"),
+            "End" = GREATEST(trade_bar_windows."End", EXCLUDED."End");
+    """, [
+        (int(row.TradeId), timeframe, str(row.Symbol), pd.Timestamp(row.Start).to_pydatetime(),
+         pd.Timestamp(row.End).to_pydatetime())
+        for row in windows.itertuples(index=False)
+    ])
+
+
+def insert_trade_bar_windows(windows, timeframe, database_config):
+    """
+    Record trade windows over symbol bars that are already stored
+    (symbol storage mode, no bars are written). Returns True on success.
+    """
+    if windows is None or windows.empty:
+        return True
+
+    conn, cur = get_connection_and_cursor(database_config)
+
+    try:
+        upsert_trade_windows(cur, windows[['TradeId', 'Symbol', 'Start', 'End']], timeframe)
+        conn.commit()
+        invalidate_trade_bundles(trade_ids=windows['TradeId'].unique())
+        print(f"Recorded {timeframe} windows for {len(windows)} trades over stored symbol bars")
+        return True
+
+    except Exception as e:
+        print(f"Error recording {timeframe} trade windows: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+@instrumented("insert_symbol_bars_to_db")
+def insert_symbol_bars_to_db(data, timeframe, database_config):
+    """
+    Symbol-level storage write:
+    - Bars are upserted once per (Symbol, timestamp); overlapping trade windows share rows
+    - Indicator values already stored are kept, missing ones (window warm-up) are filled
+    - Each TradeId's window is recorded in trade_bar_windows
+    """
+    conn, cur = get_connection_and_cursor(database_config)
+
+    try:
+        if data is None or data.empty:
+            print(f"No {timeframe} market data to insert.")
+            return True
+
+        table, columns, key_columns, indicator_columns = SYMBOL_BAR_TABLES[timeframe]
+
+        bars = data.drop_duplicates(subset=key_columns, keep='first')[columns]
+        bars = bars.astype(object).where(pd.notnull(bars), None)
+
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        key_list = ", ".join(f'"{col}"' for col in key_columns)
+        fill_indicators = ", ".join(
+            f'"{col}" = COALESCE({table}."{col}", EXCLUDED."{col}")' for col in indicator_columns
+        )
+
+        execute_values(cur, f"""
+            INSERT INTO {table} ({column_list})
+            VALUES %s
+            ON CONFLICT ({key_list}) DO UPDATE SET {fill_indicators};
+        """, bars.values.tolist(), page_size=1000)
+
+        windows = trade_windows(data, timeframe)
+        upsert_trade_windows(cur, windows, timeframe)
+
+        conn.commit()
+        invalidate_trade_bundles(symbols=bars['Symbol'].unique())
+        print(f"Inserting {timeframe} bars: {len(bars)} symbol bars for {len(windows)} trades")
+        return True
+
+    except Exception as e:
+        print(f"Error inserting {timeframe} symbol bars: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_connection(conn)
+
+
+def store_marketdata(data, timeframe, database_config, storage_mode="per_trade"):
+    """
+    Write handler output in the configured storage mode:
+    - per_trade: marketdatad / marketdata30mins / marketdataintrad keyed by TradeId
+    - symbol: bars stored once per symbol plus trade windows
+    A failed batch is retried trade by trade, so one bad trade does not drop the others.
+    Returns True when every trade was written.
+    """
+    if storage_mode == "symbol":
+        insert = lambda rows: insert_symbol_bars_to_db(rows, timeframe, database_config)
+    elif timeframe == "daily":
+        insert = lambda rows: insert_marketdata_to_db(rows, database_config)
+    elif timeframe == "30mins":
+        insert = lambda rows: insert_marketdata30mins_to_db(rows, database_config)
+    else:
+        insert = lambda rows: insert_marketdataintrad_to_db(rows, database_config)
+
+    if insert(data):
+        return True
+    if data['TradeId'].nunique() <= 1:
+        return False
+
+    print(f"Retrying {timeframe} market data trade by trade")
+    results = [insert(trade_rows) for _, trade_rows in data.groupby('TradeId', sort=False)]
+    print(f"{timeframe} market data: {sum(results)} of {len(results)} trades written")
+    return all(results)
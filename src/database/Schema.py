@@ -0,0 +1,342 @@
+from datetime import date
+
+import pandas as pd
+
+from database.ConnectionPool import acquire_connection, release_connection
+
+
+# Versioned schema. Each migration runs once, in its own transaction,
+# and is recorded in schema_migrations. New changes are appended, never edited.
+
+BASE_TABLES_DDL = """
+    CREATE TABLE IF NOT EXISTS trades (
+        "TradeId" serial PRIMARY KEY,
+        "Symbol" text NOT NULL,
+        "Date" date NOT NULL,
+        CONSTRAINT unique_trade UNIQUE ("Symbol", "Date")
+    );
+
+    CREATE TABLE IF NOT EXISTS executions (
+        "ExecutionId" serial PRIMARY KEY,
+        "Symbol" text NOT NULL,
+        "Date" date NOT NULL,
+        "Time" time NOT NULL,
+        "PermId" text NOT NULL,
+        "AvgPrice" double precision,
+        "Shares" integer,
+        "Side" text,
+        "Commission" double precision,
+        "AdjustedAvgPrice" double precision,
+        CONSTRAINT unique_permid UNIQUE ("PermId")
+    );
+
+    CREATE TABLE IF NOT EXISTS marketdatad (
+        "Symbol" text NOT NULL,
+        "Date" date NOT NULL,
+        "Open" double precision,
+        "High" double precision,
+        "Low" double precision,
+        "Close" double precision,
+        "Volume" bigint,
+        "5DayAvgVolume" double precision,
+        "RelativeVolume" double precision,
+        "TradeId" integer NOT NULL REFERENCES trades ("TradeId"),
+        CONSTRAINT unique_marketdatad UNIQUE ("Symbol", "Date", "TradeId")
+    );
+
+    CREATE TABLE IF NOT EXISTS marketdata30mins (
+        "Symbol" text NOT NULL,
+        "Date" timestamp NOT NULL,
+        "Open" double precision,
+        "High" double precision,
+        "Low" double precision,
+        "Close" double precision,
+        "Volume" bigint,
+        "EMA65" double precision,
+        "TradeId" integer NOT NULL REFERENCES trades ("TradeId"),
+        CONSTRAINT unique_market30 UNIQUE ("Symbol", "Date", "TradeId")
+    );
+
+    -- Intraday bars are the largest table: range partitioned by month on Date.
+    -- The unique constraint has to include the partition key.
+    CREATE TABLE IF NOT EXISTS marketdataintrad (
+        "Symbol" text NOT NULL,
+        "Date" date NOT NULL,
+        "Time" time NOT NULL,
+        "Open" double precision,
+        "High" double precision,
+        "Low" double precision,
+        "Close" double precision,
+        "Volume" bigint,
+        "VWAP" double precision,
+        "EMA9" double precision,
+        "Relatr" double precision,
+        "TradeId" integer NOT NULL REFERENCES trades ("TradeId"),
+        CONSTRAINT unique_marketdataintrad UNIQUE ("Symbol", "Date", "Time", "TradeId")
+    ) PARTITION BY RANGE ("Date");
+
+    -- Catches rows outside the monthly partitions (only when the table is partitioned;
+    -- databases created before this migration keep their plain table)
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = 'marketdataintrad'
+        ) THEN
+            CREATE TABLE IF NOT EXISTS marketdataintrad_default PARTITION OF marketdataintrad DEFAULT;
+        END IF;
+    END $$;
+"""
+
+INDEXES_DDL = """
+    -- B-tree for per-trade lookups and symbol/date joins
+    CREATE INDEX IF NOT EXISTS idx_marketdatad_tradeid ON marketdatad ("TradeId");
+    CREATE INDEX IF NOT EXISTS idx_marketdata30mins_tradeid ON marketdata30mins ("TradeId");
+    CREATE INDEX IF NOT EXISTS idx_marketdataintrad_tradeid ON marketdataintrad ("TradeId");
+    CREATE INDEX IF NOT EXISTS idx_executions_symbol_date ON executions ("Symbol", "Date");
+    CREATE INDEX IF NOT EXISTS idx_marketdatad_symbol_date ON marketdatad ("Symbol", "Date");
+
+    -- BRIN for range scans on append-only, time ordered data
+    CREATE INDEX IF NOT EXISTS brin_marketdatad_date ON marketdatad USING brin ("Date");
+    CREATE INDEX IF NOT EXISTS brin_marketdata30mins_date ON marketdata30mins USING brin ("Date");
+    CREATE INDEX IF NOT EXISTS brin_marketdataintrad_date ON marketdataintrad USING brin ("Date");
+"""
+
+SYMBOL_BAR_STORAGE_DDL = """
+    CREATE TABLE IF NOT EXISTS bars_daily (
+        "Symbol" text NOT NULL,
+        "Date" date NOT NULL,
+        "Open" double precision,
+        "High" double precision,
+        "Low" double precision,
+        "Close" double precision,
+        "Volume" bigint,
+        "5DayAvgVolume" double precision,
+        "RelativeVolume" double precision,
+        PRIMARY KEY ("Symbol", "Date")
+    );
+
+    CREATE TABLE IF NOT EXISTS bars_30mins (
+        "Symbol" text NOT NULL,
+        "Date" timestamp NOT NULL,
+        "Open" double precision,
+        "High" double precision,
+        "Low" double precision,
+        "Close" double precision,
+        "Volume" bigint,
+        "EMA65" double precision,
+        PRIMARY KEY ("Symbol", "Date")
+    );
+
+    CREATE TABLE IF NOT EXISTS bars_intraday (
+        "Symbol" text NOT NULL,
+        "Date" date NOT NULL,
+        "Time" time NOT NULL,
+        "Open" double precision,
+        "High" double precision,
+        "Low" double precision,
+        "Close" double precision,
+        "Volume" bigint,
+        "VWAP" double precision,
+        "EMA9" double precision,
+        "Relatr" double precision,
+        PRIMARY KEY ("Symbol", "Date", "Time")
+    );
+
+    CREATE TABLE IF NOT EXISTS trade_bar_windows (
+        "TradeId" integer NOT NULL,
+        "Timeframe" text NOT NULL,
+        "Symbol" text NOT NULL,
+        "Start" timestamp NOT NULL,
+        "End" timestamp NOT NULL,
+        PRIMARY KEY ("TradeId", "Timeframe")
+    );
+
+    CREATE INDEX IF NOT EXISTS brin_bars_intraday_date ON bars_intraday USING brin ("Date");
+    CREATE INDEX IF NOT EXISTS idx_trade_bar_windows_symbol ON trade_bar_windows ("Symbol", "Timeframe");
+
+    CREATE OR REPLACE VIEW marketdatad_by_trade AS
+    SELECT b."Symbol", b."Date", b."Open", b."High", b."Low", b."Close", b."Volume",
+           b."5DayAvgVolume", b."RelativeVolume", w."TradeId"
+    FROM trade_bar_windows w
+    JOIN bars_daily b
+      ON b."Symbol" = w."Symbol"
+     AND b."Date" BETWEEN w."Start"::date AND w."End"::date
+    WHERE w."Timeframe" = 'daily';
+
+    CREATE OR REPLACE VIEW marketdata30mins_by_trade AS
+    SELECT b."Symbol", b."Date", b."Open", b."High", b."Low", b."Close", b."Volume",
+           b."EMA65", w."TradeId"
+    FROM trade_bar_windows w
+    JOIN bars_30mins b
+      ON b."Symbol" = w."Symbol"
+     AND b."Date" BETWEEN w."Start" AND w."End"
+    WHERE w."Timeframe" = '30mins';
+
+    CREATE OR REPLACE VIEW marketdataintrad_by_trade AS
+    SELECT b."Symbol", b."Date", b."Time", b."Open", b."High", b."Low", b."Close", b."Volume",
+           b."VWAP", b."EMA9", b."Relatr", w."TradeId"
+    FROM trade_bar_windows w
+    JOIN bars_intraday b
+      ON b."Symbol" = w."Symbol"
+     AND b."Date" + b."Time" BETWEEN w."Start" AND w."End"
+    WHERE w."Timeframe" = 'intraday';
+"""
+
+FETCH_JOBS_DDL = """
+    -- One job per (TradeId, timeframe) that still needs market data.
+    -- Workers claim jobs with FOR UPDATE SKIP LOCKED; running jobs whose
+    -- worker died are reclaimed after a timeout.
+    CREATE TABLE IF NOT EXISTS fetch_jobs (
+        "TradeId" integer NOT NULL REFERENCES trades ("TradeId"),
+        "Timeframe" text NOT NULL,
+        "Status" text NOT NULL DEFAULT 'pending',
+        "Attempts" integer NOT NULL DEFAULT 0,
+        "LastError" text,
+        "Worker" text,
+        "ClaimedAt" timestamptz,
+        "UpdatedAt" timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY ("TradeId", "Timeframe"),
+        CONSTRAINT fetch_jobs_status CHECK ("Status" IN ('pending', 'running', 'done', 'failed'))
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_fetch_jobs_open ON fetch_jobs ("Status", "TradeId")
+        WHERE "Status" <> 'done';
+"""
+
+# (version, description, sql)
+MIGRATIONS = [
+    (1, "base tables, intraday bars partitioned by month", BASE_TABLES_DDL),
+    (2, "b-tree and brin indexes", INDEXES_DDL),
+    (3, "symbol-level bar storage and trade windows", SYMBOL_BAR_STORAGE_DDL),
+    (4, "durable fetch job queue", FETCH_JOBS_DDL),
+]
+
+# Arbitrary key so concurrent runs apply migrations one at a time
+MIGRATION_LOCK_KEY = 1202
+
+
+def applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            "Version" integer PRIMARY KEY,
+            "Description" text NOT NULL,
+            "AppliedAt" timestamptz NOT NULL DEFAULT now()
+        );
+    """)
+    cur.execute('SELECT "Version" FROM schema_migrations;')
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(database_config):
+    """
+    Apply pending migrations in version order.
+    Returns the list of versions applied in this run.
+    """
+    conn = acquire_connection(database_config)
+    cur = conn.cursor()
+    applied = []
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+        done = applied_versions(cur)
+        conn.commit()
+
+        for version, description, sql in MIGRATIONS:
+            if version in done:
+                continue
+            try:
+                cur.execute(sql)
+                cur.execute(
+                    'INSERT INTO schema_migrations ("Version", "Description") VALUES (%s, %s);',
+                    (version, description)
+                )
+                conn.commit()
+                applied.append(version)
+                print(f"Applied migration {version}: {description}")
+            except Exception as e:
+                conn.rollback()
+                print(f"Migration {version} ({description}) failed: {e}")
+                raise
+
+        if not applied:
+            print("Database schema is up to date.")
+        return applied
+
+    finally:
+        try:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+        cur.close()
+        release_connection(conn)
+
+
+def month_starts(dates):
+    """Distinct first-of-month dates covering the given dates."""
+    months = pd.to_datetime(pd.Series(list(dates)).astype(str), format='mixed').dt.to_period('M').drop_duplicates()
+    return sorted(period.to_timestamp().date() for period in months)
+
+
+def partition_name(month_start):
+    return f"marketdataintrad_{month_start:%Y_%m}"
+
+
+def ensure_intraday_partitions(database_config, dates):
+    """
+    Create the monthly marketdataintrad partitions for the given dates.
+    Does nothing when marketdataintrad is a plain (unpartitioned) table.
+    A month whose rows already landed in the default partition is left there
+    and reported, creating the partition would conflict with those rows.
+    """
+    months = month_starts(dates)
+    if not months:
+        return []
+
+    conn = acquire_connection(database_config)
+    cur = conn.cursor()
+    created = []
+    try:
+        cur.execute("""
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = 'marketdataintrad';
+        """)
+        if cur.fetchone() is None:
+            conn.rollback()
+            return created
+
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = 'marketdataintrad';
+        """)
+        existing = {row[0] for row in cur.fetchall()}
+        conn.commit()
+
+        for month_start in months:
+            name = partition_name(month_start)
+            if name in existing:
+                continue
+            next_month = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+            try:
+                # Partition bounds must be literals
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF marketdataintrad "
+                    f"FOR VALUES FROM ('{month_start:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}');"
+                )
+                conn.commit()
+                created.append(name)
+            except Exception as e:
+                conn.rollback()
+                print(f"Could not create partition {name}, rows stay in the default partition: {e}")
+
+        if created:
+            print(f"Created intraday partitions: {', '.join(created)}")
+        return created
+
+    finally:
+        cur.close()
+        release_connection(conn)
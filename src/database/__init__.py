@@ -1,3 +1,5 @@
 __all__ = [
+    "ConnectionPool",
     "DBfunctions",
-]
\ No newline at end of file
+    "Schema",
+]
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+# Columnar parquet files when pyarrow is available, pickle otherwise
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = "parquet"
+except ImportError:
+    CACHE_FORMAT = "pickle"
+
+
+class BarCache:
+    """
+    On-disk cache of historical bar DataFrames keyed by
+    symbol, bar size, whatToShow, RTH flag, end timestamp and duration.
+    - Size bounded: least recently used files are evicted above max_bytes
+    - Bars of windows that end today (partial session) expire after partial_ttl_seconds
+    Each entry is a self-describing file (mtime = created, atime = last access),
+    so several worker processes can share the folder without a shared index.
+    """
+
+    def __init__(self, folder, max_bytes=512 * 1024 * 1024, partial_ttl_seconds=300,
+                 exchange_timezone="US/Eastern"):
+        self.folder = folder
+        self.max_bytes = int(max_bytes)
+        self.partial_ttl_seconds = partial_ttl_seconds
+        self.exchange_timezone = exchange_timezone
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(folder, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, project_config):
+        """
+        Build the cache from the bar_cache section of config.json, None if disabled.
+        Disabled while recording IB responses (ib_replay mode "record"): cache hits
+        never reach IB, so they would be missing from the archive.
+        """
+        cache_config = project_config.get('bar_cache', {})
+        if not cache_config.get('enabled', False):
+            return None
+        if project_config.get('ib_replay', {}).get('mode', 'off') == 'record':
+            print("Bar cache disabled while recording IB responses.")
+            return None
+        return cls(
+            cache_config['folder'],
+            max_bytes=cache_config.get('max_bytes', 512 * 1024 * 1024),
+            partial_ttl_seconds=cache_config.get('partial_ttl_seconds', 300),
+            exchange_timezone=project_config.get('timezones', {}).get('exchange', "US/Eastern")
+        )
+
+    def _filename(self, request):
+        identity = "|".join([
+            request.symbol, request.bar_size, request.what_to_show,
+            str(int(request.use_rth)), request.end_date_time, request.duration
+        ])
+        digest = hashlib.sha1(identity.encode()).hexdigest()[:16]
+        bar_size = request.bar_size.replace(" ", "")
+        return f"{request.symbol}_{bar_size}_{request.what_to_show}_{int(request.use_rth)}_{digest}.{CACHE_FORMAT}"
+
+    def _is_partial(self, request):
+        """True when the requested window ends today or later in exchange time."""
+        try:
+            end_date = datetime.strptime(request.end_date_time[:8], "%Y%m%d").date()
+        except ValueError:
+            return True
+        return end_date >= datetime.now(ZoneInfo(self.exchange_timezone)).date()
+
+    def _remove(self, filename):
+        # Another process may have evicted the entry already
+        try:
+            os.remove(os.path.join(self.folder, filename))
+        except FileNotFoundError:
+            pass
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, request):
+        """Return cached bars for the request or None."""
+        filename = self._filename(request)
+        path = os.path.join(self.folder, filename)
+        try:
+            created = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return self._miss()
+
+        if self._is_partial(request) and time.time() - created > self.partial_ttl_seconds:
+            self._remove(filename)
+            return self._miss()
+
+        try:
+            if CACHE_FORMAT == "parquet":
+                bars_df = pd.read_parquet(path)
+            else:
+                with open(path, 'rb') as f:
+                    bars_df = pickle.load(f)
+            # Record the access for LRU eviction, keeping mtime as the creation time
+            os.utime(path, (time.time(), created))
+        except FileNotFoundError:
+            return self._miss()
+        except Exception as e:
+            print(f"Bar cache entry {filename} unreadable ({e}), dropping it.")
+            self._remove(filename)
+            return self._miss()
+
+        with self._lock:
+            self.hits += 1
+        return bars_df
+
+    def put(self, request, bars_df):
+        """Store bars for the request and evict least recently used entries above max_bytes."""
+        if bars_df is None or bars_df.empty:
+            return
+
+        filename = self._filename(request)
+        path = os.path.join(self.folder, filename)
+        # Write to a private temp file and rename, so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if CACHE_FORMAT == "parquet":
+                bars_df.to_parquet(tmp_path, index=False)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(bars_df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Could not write bar cache entry {filename}: {e}")
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            return
+
+        self._evict()
+
+    def _entries(self):
+        """(last_access, size, filename) of every cache entry currently in the folder."""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.name.endswith(f".{CACHE_FORMAT}"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.name))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            self._remove(filename)
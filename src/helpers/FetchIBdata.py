@@ -4,200 +4,589 @@ from helpers.HandleDataFrames import *
 from database.DBfunctions import *
 from common.ReadConfigsIn import *
 from common.Calculate import *
+from common.AdjustTimezone import to_local_datetime, configured_timezones, EXCHANGE_TIMEZONE
+from helpers.HistoricalScheduler import HistoricalDataScheduler, HistoricalRequest
+from helpers.ResampleBars import resample_bars, chunk_count, chunk_end_dates, combine_chunks
+from helpers.IBRecordReplay import create_ib_client
+from helpers.TradePipeline import StagedPipeline
+from common.IndicatorState import IndicatorSet, IndicatorStateStore
+from common.Instrumentation import instrumented, stage, count_rows
+
+def trade_end_date(date):
+    """IB endDateTime at the close of the extended session on the trade date."""
+    # Remove hyphens from the date string to get e.g. '20240514'
+    date_str = str(date).replace('-', '')
+    return f"{date_str} 16:59:59 US/Eastern"
+
+
+def trade_requests(df_data, bar_size, durationStr):
+    """Build one HistoricalRequest per trade row."""
+    return [
+        HistoricalRequest(
+            symbol=row['Symbol'],
+            end_date_time=trade_end_date(row['Date']),
+            duration=durationStr,
+            bar_size=bar_size
+        )
+        for _, row in df_data.iterrows()
+    ]
 
-# Daily
-def daily_data(df_data, ib, bar_size, durationStr, database_config):
 
+def duration_days(durationStr):
+    """Convert an IB durationStr like '200 D' or '1 M' into days."""
+    amount, unit = durationStr.split()
+    return int(amount) * {"D": 1, "W": 7, "M": 30, "Y": 365}[unit.upper()]
 
-    for _, row in df_data.iterrows():
-        symbol = row['Symbol']
-        date = row['Date']
-        # Remove hyphens from the date string to get e.g. '20240514'
-        date_str = str(date).replace('-', '')
-        end_date = f"{date_str} 16:59:59 US/Eastern"
-        trade_id = row['TradeId']
 
-        # Check if trade_id already exists
-        if fetch_individual_trade(database_config, 'marketdatad', trade_id):
-            continue
+# Longest duration one request may cover, per bar size. IB rejects day
+# durations over 365 D and serves 30-min bars for about a month per request.
+MAX_COALESCED_DAYS = {"1 day": 365, "30 mins": 30}
 
-        try:
-            contract = Stock(symbol, 'SMART', 'USD')
-            contract.primaryExchange = 'ARCA'
-
-            bars = ib.reqHistoricalData(
-                contract,
-                endDateTime=end_date,
-                durationStr=durationStr,
-                barSizeSetting=bar_size,
-                whatToShow="TRADES",
-                useRTH=False,
-                formatDate=1
-            )
-        except Exception as e:
-            print(f"Failed to fetch data for {symbol} on {end_date}. Error: {e}")
-            continue
 
-        bars_df = pd.DataFrame(bars)
+def session_span(first, last, window_days):
+    """Sessions covered by the windows of trades on first..last."""
+    return window_days + int(np.busday_count(first.date(), last.date()))
 
-        # Call handler with specific TradeId row
-        data = handle_incoming_dataframe_daily(bars_df, symbol, trade_id)
 
-        insert_marketdata_to_db(data, database_config)
+def single_request_groups(dates, window_days, max_days):
+    """Group sorted trade dates greedily so each group fits one request of at most max_days: [(first, last, span)]."""
+    groups = []
+    for date in dates:
+        if groups and (max_days is None or session_span(groups[-1][0], date, window_days) <= max_days):
+            groups[-1] = (groups[-1][0], date, session_span(groups[-1][0], date, window_days))
+        else:
+            groups.append((date, date, window_days))
+    return groups
 
-# 30mins
-def midterm_data(df_data,ib, bar_size, durationStr, database_config):
-
-    for _, row in df_data.iterrows():
-        symbol = row['Symbol']
-        date = row['Date']
-        # Remove hyphens from the date string to get e.g. '20240514'
-        date_str = str(date).replace('-', '')
-        end_date = f"{date_str} 16:59:59 US/Eastern"
-        trade_id = row['TradeId']
-
-        # Check if trade_id already exists
-        if fetch_individual_trade(database_config, 'marketdata30mins', trade_id):
-            continue
-        try:
-            contract = Stock(symbol, 'SMART', 'USD')
-            contract.primaryExchange = 'ARCA'
-
-            bars = ib.reqHistoricalData(
-                contract,
-                endDateTime=end_date,
-                durationStr=durationStr,
-                barSizeSetting=bar_size,
-                whatToShow="TRADES",
-                useRTH=False,
-                formatDate=1
+
+def coalesced_requests(df_data, bar_size, durationStr, max_days=None):
+    """
+    Requests per symbol covering the union of its trades' windows (durationStr
+    sessions back from each trade date). Trades whose windows overlap, or that
+    fit in one request, form a cluster. A cluster longer than max_days
+    (MAX_COALESCED_DAYS of the bar size by default, unlimited for other bar
+    sizes) is split into chunks of max_days when that needs fewer requests than
+    grouping its trades into single requests; combine_chunks joins the bars back.
+    Returns {symbol: [HistoricalRequest, ...]}.
+    """
+    window_days = duration_days(durationStr)
+    if max_days is None:
+        max_days = MAX_COALESCED_DAYS.get(bar_size)
+
+    requests = {}
+    for symbol, trades in df_data.groupby('Symbol', sort=False):
+        dates = pd.to_datetime(trades['Date'].astype(str)).drop_duplicates().sort_values()
+
+        clusters = []
+        for date in dates:
+            if clusters and (
+                max_days is None
+                or int(np.busday_count(clusters[-1][-1].date(), date.date())) <= window_days
+                or session_span(clusters[-1][0], date, window_days) <= max_days
+            ):
+                clusters[-1].append(date)
+            else:
+                clusters.append([date])
+
+        windows = []   # (end date, duration)
+        for cluster in clusters:
+            span = session_span(cluster[0], cluster[-1], window_days)
+            groups = single_request_groups(cluster, window_days, max_days)
+            if max_days is not None and span > max_days and chunk_count(span, max_days) < len(groups):
+                end_dates = chunk_end_dates(cluster[-1].strftime('%Y%m%d'), span, max_days)
+                windows.extend((end_date, f"{max_days} D") for end_date in end_dates)
+            else:
+                windows.extend((last.strftime('%Y%m%d'), f"{group_span} D") for _, last, group_span in groups)
+
+        requests[symbol] = [
+            HistoricalRequest(
+                symbol=symbol,
+                end_date_time=trade_end_date(end_date),
+                duration=duration,
+                bar_size=bar_size
             )
+            for end_date, duration in windows
+        ]
+    return requests
 
-            bars_df = pd.DataFrame(bars)
 
-            data =  handle_incoming_dataframe_midterm(bars_df, symbol,trade_id)
-            insert_marketdata30mins_to_db(data,  database_config)
+def slice_trade_window(bars_df, date, durationStr):
+    """
+    Cut one trade's window out of a coalesced symbol series:
+    bars up to the trade's end time within its last N trading sessions
+    (IB counts 'D' durations in sessions).
+    """
+    if bars_df.empty:
+        return bars_df
 
-        except Exception as e:
-            print(f" Failed to fetch data for {symbol} on {end_date}. Error: {e}")
-            continue
+    bar_times = to_local_datetime(bars_df['date'], local_tz=EXCHANGE_TIMEZONE).dt.tz_localize(None)
+    end_time = pd.Timestamp(f"{pd.Timestamp(str(date)).date()} 16:59:59")
 
-# Intraday
-def intraday_data(df_data, ib, bar_size, durationStr, database_config):
-    """Fetch intraday data and ATR separately for each trade."""
-    all_data = []  # collect each trade's data if you want to return them
+    in_range = (bar_times <= end_time).to_numpy()
+    sessions = bar_times[in_range].dt.normalize().drop_duplicates()
+    first_session = sessions.nlargest(duration_days(durationStr)).min()
 
-    for _, row in df_data.iterrows():
-        symbol = row['Symbol']  # adjust to your actual column name
-        date = row['Date']
-        trade_id = row['TradeId']
+    keep = in_range & (bar_times.dt.normalize() >= first_session).to_numpy()
+    return bars_df[keep].reset_index(drop=True)
 
-        # skip if already in DB
-        if fetch_individual_trade(database_config, 'marketdataintrad', trade_id):
-            continue
 
-        # fetch ATR for this trade only (single-row DataFrame)
-        atr_df = atrdata(
-            df_data=pd.DataFrame([row]),  # one trade
-            ib=ib,
-            bar_size="1 day",
-            durationStr="14 D",
-            database_config=database_config
-        )
+def fetch_symbol_series(df_data, scheduler, bar_size, durationStr):
+    """
+    Fetch one coalesced series per symbol (several requests combined when its trades
+    are far apart or their union exceeds the bar size's duration limit).
+    Not a stage of its own: its requests and IB wait count towards the calling stage.
+    Returns {symbol: bars DataFrame}.
+    """
+    plan = coalesced_requests(df_data, bar_size, durationStr)
+    frames = iter(scheduler.fetch_all([request for requests in plan.values() for request in requests]))
+    return {symbol: combine_chunks([next(frames) for _ in requests]) for symbol, requests in plan.items()}
+
 
-        # Build IB contract and end_date
-        date_str = str(date).replace('-', '')
-        end_date = f"{date_str} 16:59:59 US/Eastern"
-
-        try:
-            contract = Stock(symbol, 'SMART', 'USD')
-            contract.primaryExchange = 'ARCA'
-
-            bars = ib.reqHistoricalData(
-                contract,
-                endDateTime=end_date,
-                durationStr=durationStr,
-                barSizeSetting=bar_size,
-                whatToShow="TRADES",
-                useRTH=False,
-                formatDate=1
+@instrumented("fetch_base_series")
+def fetch_base_series(df_data, scheduler, base_bar_size, durationStr, chunk_duration):
+    """
+    One fine series per symbol covering the union of its trades' windows,
+    requested in chunks of chunk_duration (IB limits the duration per bar size).
+    Returns {symbol: bars DataFrame}.
+    """
+    chunk_days = duration_days(chunk_duration)
+    plan = {}
+    for symbol, requests in coalesced_requests(df_data, base_bar_size, durationStr).items():
+        plan[symbol] = [
+            HistoricalRequest(
+                symbol=symbol,
+                end_date_time=trade_end_date(end_date),
+                duration=chunk_duration,
+                bar_size=base_bar_size
             )
+            for request in requests
+            for end_date in chunk_end_dates(request.end_date_time[:8], duration_days(request.duration), chunk_days)
+        ]
 
-        except Exception as e:
-            print(f"Failed to fetch data for {symbol} on {end_date}. Error: {e}")
-            continue
+    frames = iter(scheduler.fetch_all([request for requests in plan.values() for request in requests]))
+    return {symbol: combine_chunks([next(frames) for _ in requests]) for symbol, requests in plan.items()}
+
+
+def derived_frames(base_frames, bar_size, use_rth=False, exchange_timezone=EXCHANGE_TIMEZONE):
+    """Resample every symbol's fine series to bar_size."""
+    return {
+        symbol: resample_bars(bars_df, bar_size, use_rth, exchange_timezone)
+        for symbol, bars_df in base_frames.items()
+    }
 
-        # Convert bars to DataFrame
-        bars_df = pd.DataFrame(bars)
-  
-        # handle and calculate relATR
-        data = handle_incoming_dataframe_intraday(bars_df, symbol, trade_id)
-        print(data)
-        print(atr_df)
-        intraday_with_relatr = calculate_relatr(data, atr_df)
- 
 
-        # insert into DB
-        insert_marketdataintrad_to_db(intraday_with_relatr, database_config)
+def prior_daily_bars(daily_bars, date, period=14):
+    """The last `period` daily bars before the trade date."""
+    if daily_bars is None or daily_bars.empty:
+        return None
 
+    bar_days = to_local_datetime(daily_bars['date'], local_tz=EXCHANGE_TIMEZONE).dt.tz_localize(None).dt.normalize()
+    return daily_bars[(bar_days < pd.Timestamp(str(date)).normalize()).to_numpy()].tail(period)
 
 
-# Fetching ATR data until previous day on trade
-def atrdata(df_data, ib, bar_size, durationStr, database_config):
+def long_format(pieces):
     """
-    Fetch last 14 days of daily historical data from IB for each trade symbol.
-    End date is set to the trade date (exclusive), so last bar is the day before.
-    Returns a list of tuples: (symbol, trade_id, DataFrame with ATR).
+    Concatenate per-trade bar frames into one long frame tagged with Symbol and TradeId.
+    pieces: iterable of (symbol, trade_id, bars_df)
     """
+    frames = [
+        bars_df.assign(Symbol=symbol, TradeId=trade_id)
+        for symbol, trade_id, bars_df in pieces
+        if bars_df is not None and not bars_df.empty
+    ]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 
-    for _, row in df_data.iterrows():
-        symbol = row['Symbol']
-        trade_id = row.get("TradeId", None)
-        ref_date = row['Date']
+def process_bars(timeframe, compute, bars, database_config, storage_mode="per_trade", pipeline=None,
+                 on_stored=None):
+    """
+    Compute indicators with compute(*bars) and store the result,
+    inline or handed to the compute/write stages of a StagedPipeline.
+    on_stored() runs once the result was stored completely.
+    """
+    if pipeline is not None:
+        pipeline.submit(timeframe, compute, *bars, on_stored=on_stored)
+        return
 
-        # End time = trade date at 00:00:00 (exclusive)
-        end_dt_str = ref_date.strftime('%Y%m%d %H:%M:%S')
+    data = compute(*bars)
+    if data is not None and not data.empty:
+        if store_marketdata(data, timeframe, database_config, storage_mode) and on_stored is not None:
+            on_stored()
 
-        contract = Stock(symbol, "SMART", "USD")
 
-        try:
-            bars = ib.reqHistoricalData(
-                contract,
-                endDateTime=end_dt_str,
-                durationStr=durationStr,
-                barSizeSetting=bar_size,
-                whatToShow="TRADES",
-                useRTH=True
-            )
+# Symbol storage with persisted indicator state (indicator_state section of config.json).
+# Symbol bars are stored once, so a trade whose window starts inside the continuous
+# range a symbol's IndicatorSet has seen only needs the sessions after its last bar:
+# the state advances with those bars alone and the trade's window is recorded over
+# the stored bars. Symbols without state are fetched in full and seed it.
+
+INCREMENTAL_TIMEFRAMES = {
+    # timeframe: (bar size, length of the last bar of a trade window)
+    "daily": ("1 day", pd.Timedelta(0)),
+    "30mins": ("30 mins", pd.Timedelta(minutes=30)),
+}
 
-            if not bars:
-                print(f"No data returned for {symbol}")
-                continue
+STATE_COLUMNS = ['Symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'TradeId']
 
-            # Convert bars to pandas DataFrame before handling
-            bars_df = pd.DataFrame(bars)
 
-            # Now call your handle_incoming_dataframe_daily
-            df_processed = handle_incoming_dataframe_atr(bars_df, symbol, trade_id)
+def trade_window_bounds(date, durationStr, timeframe, timezones=None):
+    """Start/End of a trade's window in stored bar time (local time for 30-min bars)."""
+    trade_day = pd.Timestamp(str(date)).normalize()
+    start = trade_day - pd.offsets.BDay(duration_days(durationStr) - 1)
+    if timeframe == "daily":
+        return start, trade_day
 
+    exchange_tz, local_tz = configured_timezones(timezones)
+    to_local = lambda stamp: stamp.tz_localize(exchange_tz).tz_convert(local_tz).tz_localize(None)
+    return to_local(start), to_local(trade_day + pd.Timedelta(hours=16, minutes=59, seconds=59))
 
-        except Exception as e:
-            print(f"Error fetching data for {symbol}: {e}")
+
+def state_bars(bars_df, symbol, trade_id, timeframe, timezones=None):
+    """Raw IB bars of one symbol in the stored layout the IndicatorSet advances on."""
+    df = prepare_bars_batch(bars_df.assign(Symbol=symbol, TradeId=trade_id))
+    if df is None:
+        return None
+    if timeframe == "30mins":
+        df = df.assign(Date=local_bar_times(df['Date'], timezones))
+    return df[STATE_COLUMNS]
+
+
+def split_incremental_trades(trades, timeframe, durationStr, state_store, timezones=None):
+    """
+    Split trades into those served from their symbol's saved IndicatorSet
+    (window starts inside its range) and those that need a full fetch.
+    Returns (incremental trades with Start/End, full trades, {symbol: IndicatorSet}).
+    """
+    if trades.empty:
+        return trades.assign(Start=pd.NaT, End=pd.NaT), trades, {}
+
+    states = {}
+    for symbol in trades['Symbol'].unique():
+        state = state_store.load(symbol, timeframe)
+        if state.first_timestamp is not None:
+            states[symbol] = state
+
+    bounds = [trade_window_bounds(date, durationStr, timeframe, timezones) for date in trades['Date']]
+    windows = trades.assign(Start=[start for start, _ in bounds], End=[end for _, end in bounds])
+    first = pd.to_datetime(windows['Symbol'].map(
+        lambda symbol: states[symbol].first_timestamp if symbol in states else None
+    ))
+    incremental = (windows['Start'] >= first).to_numpy()
+    return windows[incremental], trades[~incremental], states
+
+
+@instrumented("incremental_symbol_data")
+def incremental_symbol_data(trades, timeframe, scheduler, database_config, state_store, states, timezones=None):
+    """
+    For trades split off by split_incremental_trades:
+    - Request only the sessions after each symbol's last state bar
+    - Advance the state with the new bars and store them
+    - Record the windows of the trades the stored bars now cover
+    A symbol's state is saved only after its bars were stored.
+    """
+    if trades.empty:
+        return
+
+    bar_size, last_bar_length = INCREMENTAL_TIMEFRAMES[timeframe]
+    plan = {}
+    for symbol, symbol_trades in trades.groupby('Symbol', sort=False):
+        last = pd.Timestamp(states[symbol].last_timestamp)
+        latest = symbol_trades.loc[symbol_trades['End'].idxmax()]
+        if latest['End'] - last_bar_length > last:
+            plan[symbol] = (latest, HistoricalRequest(
+                symbol=symbol,
+                end_date_time=trade_end_date(latest['Date']),
+                duration=f"{int(np.busday_count(last.date(), latest['End'].date())) + 1} D",
+                bar_size=bar_size
+            ))
+
+    frames = scheduler.fetch_all([request for _, request in plan.values()])
+    for (symbol, (latest, _)), bars_df in zip(plan.items(), frames):
+        state = states[symbol]
+        bars = state_bars(bars_df, symbol, int(latest['TradeId']), timeframe, timezones) if not bars_df.empty else None
+        data = state.update(bars) if bars is not None else None
+        if data is None or data.empty:
+            print(f"No new {timeframe} bars for {symbol} after {state.last_timestamp}")
             continue
+        if timeframe == "daily":
+            data = data.assign(Date=pd.to_datetime(data['Date'].astype(str)).dt.date)
+        if store_marketdata(data, timeframe, database_config, "symbol"):
+            state_store.save(symbol, state)
+        else:
+            states[symbol] = state_store.load(symbol, timeframe)
+
+    # Trades whose last bar the (saved) state has reached are covered by stored bars
+    last = pd.to_datetime(trades['Symbol'].map(lambda symbol: states[symbol].last_timestamp))
+    covered = trades[(trades['End'] - last_bar_length <= last).to_numpy()]
+    insert_trade_bar_windows(covered, timeframe, database_config)
+    if len(covered) < len(trades):
+        print(f"{len(trades) - len(covered)} {timeframe} trades not covered by the indicator state yet")
+
+
+def seed_indicator_states(trades, symbol_frames, timeframe, durationStr, state_store, timezones=None):
+    """
+    After a full fetch was stored, start each symbol's IndicatorSet from the window of its
+    latest trade, a continuous range of stored bars. A saved state reaching further is kept.
+    """
+    for symbol, symbol_trades in trades.groupby('Symbol', sort=False):
+        latest = symbol_trades.loc[pd.to_datetime(symbol_trades['Date'].astype(str)).idxmax()]
+        window = slice_trade_window(symbol_frames.get(symbol, pd.DataFrame()), latest['Date'], durationStr)
+        bars = state_bars(window, symbol, int(latest['TradeId']), timeframe, timezones) if not window.empty else None
+        if bars is None:
+            continue
+
+        seeded = IndicatorSet(timeframe)
+        seeded.update(bars)
+        saved = state_store.load(symbol, timeframe)
+        if saved.last_timestamp is None or pd.Timestamp(seeded.last_timestamp) > pd.Timestamp(saved.last_timestamp):
+            state_store.save(symbol, seeded)
+
+
+def compute_intraday(bars_df, atr_bars_df, timezones=None):
+    """
+    Intraday indicators plus Relatr from the ATR of the prior daily bars.
+    Trades without prior daily bars keep their bars with a NULL Relatr.
+    """
+    data = handle_incoming_dataframes_intraday_batch(bars_df, timezones)
+    if data is None:
+        return None
+
+    atr_df = handle_incoming_dataframes_atr_batch(atr_bars_df)
+    has_atr = data['TradeId'].isin(atr_df['TradeId'] if atr_df is not None else [])
+    for trade_id in data.loc[~has_atr, 'TradeId'].unique():
+        print(f"No daily bars before the trade date for TradeId={trade_id}, storing bars without Relatr.")
+
+    data = calculate_relatr(data, atr_df) if atr_df is not None else data.assign(Relatr=np.nan)
+    return data.assign(Relatr=data['Relatr'].where(has_atr))
+
 
-    return df_processed
+# Daily
+@instrumented("daily_data")
+def daily_data(df_data, ib, bar_size, durationStr, database_config, scheduler=None, symbol_frames=None,
+               storage_mode="per_trade", pipeline=None, state_store=None):
+    """
+    Fetch daily bars (or reuse symbol_frames already fetched for this window).
+    With state_store the symbols' indicator states are seeded once the bars are stored.
+    Returns the per-symbol series so later stages can reuse them.
+    """
+    scheduler = scheduler or HistoricalDataScheduler(ib)
 
+    # One request per symbol, sliced per TradeId locally
+    if symbol_frames is None:
+        symbol_frames = fetch_symbol_series(df_data, scheduler, bar_size, durationStr)
 
+    # All trades in one long frame, one grouped pass and one bulk write
+    bars_df = long_format(
+        (row['Symbol'], row['TradeId'], slice_trade_window(symbol_frames[row['Symbol']], row['Date'], durationStr))
+        for _, row in df_data.iterrows()
+    )
+    if bars_df.empty:
+        return symbol_frames
 
+    on_stored = None
+    if state_store is not None:
+        on_stored = lambda: seed_indicator_states(df_data, symbol_frames, "daily", durationStr, state_store)
+    process_bars("daily", handle_incoming_dataframes_daily_batch, (bars_df,),
+                 database_config, storage_mode, pipeline, on_stored)
 
+    return symbol_frames
+
+# 30mins
+@instrumented("midterm_data")
+def midterm_data(df_data,ib, bar_size, durationStr, database_config, scheduler=None, symbol_frames=None,
+                 storage_mode="per_trade", pipeline=None, timezones=None, state_store=None):
+    """
+    Fetch 30-min bars (or reuse symbol_frames, e.g. derived from finer bars).
+    With state_store the symbols' indicator states are seeded once the bars are stored.
+    """
+    scheduler = scheduler or HistoricalDataScheduler(ib)
+
+    # One request per symbol, sliced per TradeId locally
+    if symbol_frames is None:
+        symbol_frames = fetch_symbol_series(df_data, scheduler, bar_size, durationStr)
+
+    # All trades in one long frame, one grouped pass and one bulk write
+    bars_df = long_format(
+        (row['Symbol'], row['TradeId'], slice_trade_window(symbol_frames[row['Symbol']], row['Date'], durationStr))
+        for _, row in df_data.iterrows()
+    )
+    if bars_df.empty:
+        return
+
+    on_stored = None
+    if state_store is not None:
+        on_stored = lambda: seed_indicator_states(df_data, symbol_frames, "30mins", durationStr, state_store, timezones)
+    process_bars("30mins", handle_incoming_dataframes_midterm_batch, (bars_df, timezones),
+                 database_config, storage_mode, pipeline, on_stored)
+
+# Intraday
+@instrumented("intraday_data")
+def intraday_data(df_data, ib, bar_size, durationStr, database_config, scheduler=None, daily_frames=None,
+                  intraday_frames=None, storage_mode="per_trade", pipeline=None, timezones=None):
+    """
+    Fetch intraday data for each trade. ATR for Relatr is derived from the
+    daily series (daily_frames) instead of a separate IB request per trade.
+    With intraday_frames (per-symbol series already at bar_size) the trade
+    windows are sliced locally instead of requested.
+    """
+    scheduler = scheduler or HistoricalDataScheduler(ib)
+
+    if daily_frames is None:
+        daily_frames = fetch_symbol_series(df_data, scheduler, "1 day", "30 D")
+
+    rows = [row for _, row in df_data.iterrows()]
+    if intraday_frames is None:
+        frames = scheduler.fetch_all(trade_requests(df_data, bar_size, durationStr))
+    else:
+        frames = [
+            slice_trade_window(intraday_frames.get(row['Symbol'], pd.DataFrame()), row['Date'], durationStr)
+            for row in rows
+        ]
+
+    bars_df = long_format(
+        (row['Symbol'], row['TradeId'], bars) for row, bars in zip(rows, frames)
+    )
+    atr_bars_df = long_format(
+        (row['Symbol'], row['TradeId'], prior_daily_bars(daily_frames.get(row['Symbol']), row['Date']))
+        for row in rows
+    )
+    if bars_df.empty:
+        print("No intraday bars to process.")
+        return
+
+    # handle and calculate relATR for all trades at once, then insert into DB
+    process_bars("intraday", compute_intraday, (bars_df, atr_bars_df, timezones),
+                 database_config, storage_mode, pipeline)
+
+
+def symbol_batches(my_trades, batch_symbols):
+    """Split the trades' symbols into lists of at most batch_symbols symbols."""
+    symbols = list(dict.fromkeys(my_trades['Symbol']))
+    return [symbols[i:i + batch_symbols] for i in range(0, len(symbols), max(1, batch_symbols))]
+
+
+def fetch_symbol_batch(batch_trades, coverage, project_config, database_config, scheduler, ib,
+                       storage_mode="per_trade", pipeline=None):
+    """
+    IB fetch stage for one batch of symbols: daily, midterm and intraday bars
+    for the trades missing them. Bars are handed to the pipeline (or processed inline).
+    """
+    daily_trades = trades_missing_marketdata(batch_trades, coverage, "daily")
+    midterm_trades = trades_missing_marketdata(batch_trades, coverage, "30mins")
+    intraday_trades = trades_missing_marketdata(batch_trades, coverage, "intraday")
+
+    timezones = project_config.get('timezones')
+    exchange_tz, _ = configured_timezones(timezones)
+
+    # Symbol storage with indicator state: trades inside a symbol's state range
+    # only need the sessions after it (incremental_symbol_data below)
+    state_store = IndicatorStateStore.from_config(project_config) if storage_mode == "symbol" else None
+    if state_store is not None:
+        daily_incremental, daily_trades, daily_states = split_incremental_trades(
+            daily_trades, "daily", "200 D", state_store
+        )
+        midterm_incremental, midterm_trades, midterm_states = split_incremental_trades(
+            midterm_trades, "30mins", "30 D", state_store, timezones
+        )
 
-def fetch_trade_data(my_trades, project_config,database_config):
+    # Derive mode: only the finest bar size is requested,
+    # 30-min and intraday bars are resampled from it locally
+    midterm_frames = intraday_frames = None
+    derivation = project_config.get('bar_derivation', {})
+    if derivation.get('enabled', False):
+        use_rth = derivation.get('use_rth', False)
+        base_frames = fetch_base_series(
+            pd.concat([midterm_trades, intraday_trades]).drop_duplicates(subset="TradeId"),
+            scheduler, derivation.get('base_bar_size', "2 mins"), "30 D",
+            derivation.get('chunk_duration', "2 D")
+        )
+        midterm_frames = derived_frames(base_frames, "30 mins", use_rth, exchange_tz)
+        intraday_frames = derived_frames(base_frames, "2 mins", use_rth, exchange_tz)
+
+    # Daily series serve both the daily table and ATR for intraday Relatr
+    atr_trades = intraday_trades
+    if state_store is not None:
+        # Without a full daily window, Relatr only needs the 14 sessions before the trade
+        atr_trades = intraday_trades[intraday_trades['TradeId'].isin(daily_trades['TradeId'])]
+    with stage("fetch_daily_series") as timer:
+        daily_frames = fetch_symbol_series(
+            pd.concat([daily_trades, atr_trades]).drop_duplicates(subset="TradeId"),
+            scheduler, "1 day", "200 D"
+        )
+        if state_store is not None:
+            atr_frames = fetch_symbol_series(
+                intraday_trades[~intraday_trades['TradeId'].isin(daily_trades['TradeId'])],
+                scheduler, "1 day", "30 D"
+            )
+            daily_frames = {
+                symbol: combine_chunks([daily_frames.get(symbol), atr_frames.get(symbol)])
+                for symbol in {**daily_frames, **atr_frames}
+            }
+        timer.rows += sum(count_rows(frame) for frame in daily_frames.values())
+
+    # # # # Fetch data at different intervals
+    daily_data(
+        df_data=daily_trades,
+        ib=ib,
+        bar_size="1 day",
+        durationStr="200 D",
+        database_config=database_config,
+        scheduler=scheduler,
+        symbol_frames=daily_frames,
+        storage_mode=storage_mode,
+        pipeline=pipeline,
+        state_store=state_store
+    )
+    midterm_data(
+        df_data=midterm_trades,
+        ib=ib,
+        bar_size="30 mins",
+        durationStr="30 D",
+        database_config=database_config,
+        scheduler=scheduler,
+        symbol_frames=midterm_frames,
+        storage_mode=storage_mode,
+        pipeline=pipeline,
+        timezones=timezones,
+        state_store=state_store
+    )
+    if state_store is not None:
+        incremental_symbol_data(daily_incremental, "daily", scheduler, database_config, state_store, daily_states)
+        incremental_symbol_data(
+            midterm_incremental, "30mins", scheduler, database_config, state_store, midterm_states, timezones
+        )
+    intraday_data(
+        df_data=intraday_trades,
+        ib=ib,
+        bar_size="2 mins",
+        durationStr="1 D",
+        database_config=database_config,
+        scheduler=scheduler,
+        daily_frames=daily_frames,
+        intraday_frames=intraday_frames,
+        storage_mode=storage_mode,
+        pipeline=pipeline,
+        timezones=timezones
+    )
+
+
+@instrumented("fetch_trade_data")
+def fetch_trade_data(my_trades, project_config,database_config, coverage=None):
     """
     Connects to IB and fetches daily, midterm, and intraday trade data.
+    Only timeframes missing in the coverage matrix are requested for each trade.
+    Fetching, indicator computation and DB writes run as overlapping pipeline stages.
     Handles connection errors gracefully.
+    Returns None when the fetch ran, otherwise the error that stopped it.
     """
-    ib = IB()
+    error = None
+    storage_mode = project_config.get('storage', {}).get('mode', 'per_trade')
+
+    if coverage is None:
+        coverage = fetch_marketdata_coverage(my_trades["TradeId"].tolist(), database_config, storage_mode)
+
+    # Live IB, or the record/replay client configured in ib_replay
+    ib = create_ib_client(project_config)
     try:
         ib.connect(
             project_config['ib_connection']['host'],
@@ -206,42 +595,29 @@ def fetch_trade_data(my_trades, project_config,database_config):
         )
         if not ib.isConnected():
             print("Could not connect to IB. Skipping fetch.")
-            return
+            return "Could not connect to IB"
 
         print("Connected to IB, starting data fetch...")
 
-        # # # # Fetch data at different intervals
-        daily_data(
-            df_data=my_trades,
-            ib=ib,
-            bar_size="1 day",
-            durationStr="200 D",
-            database_config=database_config
-        )
-        midterm_data(
-            df_data=my_trades,
-            ib=ib,
-            bar_size="30 mins",
-            durationStr="30 D",
-            database_config=database_config
-        )
-
-        intraday_data(
-            df_data=my_trades,
-            ib=ib,
-            bar_size="2 mins",
-            durationStr="1 D",
-            database_config=database_config
-        )
- 
-
-
+        # One scheduler for the run so pacing state is shared by all timeframes
+        scheduler = HistoricalDataScheduler.from_config(ib, project_config)
 
+        # Symbols are fetched in batches; while IB serves the next batch the
+        # pipeline computes and writes the previous one
+        batch_symbols = project_config.get('pipeline', {}).get('batch_symbols', 5)
+        with StagedPipeline.from_config(database_config, project_config) as pipeline:
+            for symbols in symbol_batches(my_trades, batch_symbols):
+                fetch_symbol_batch(
+                    my_trades[my_trades['Symbol'].isin(symbols)], coverage, project_config,
+                    database_config, scheduler, ib, storage_mode, pipeline
+                )
 
     except ConnectionRefusedError as e:
         print(f"Connection refused: {e}. Is TWS/Gateway running?")
+        error = f"Connection refused: {e}"
     except Exception as e:
         print(f"Error while fetching trade data: {e}")
+        error = f"Error while fetching trade data: {e}"
     finally:
         if ib.isConnected():
             ib.disconnect()
@@ -250,6 +626,7 @@ def fetch_trade_data(my_trades, project_config,database_config):
 
     # Optional: disconnect IB after fetching
     ib.disconnect()
+    return error
 
 
 
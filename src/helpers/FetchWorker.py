@@ -0,0 +1,85 @@
+import os
+import socket
+
+import pandas as pd
+
+from database.DBfunctions import (
+    MARKETDATA_TIMEFRAMES, claim_fetch_jobs, finish_fetch_jobs,
+    fetch_marketdata_coverage, ensure_intraday_partitions
+)
+from helpers.FetchIBdata import fetch_trade_data
+from common.AdjustTimezone import configured_timezones
+
+
+def worker_name(client_id):
+    """Identifies the worker in fetch_jobs."""
+    return f"{socket.gethostname()}:{os.getpid()}:client{client_id}"
+
+
+def claimed_coverage(jobs):
+    """
+    Coverage matrix in which only the claimed timeframes are missing,
+    so fetch_trade_data requests exactly the claimed jobs.
+    """
+    coverage = pd.DataFrame({"TradeId": jobs["TradeId"].unique()})
+    for timeframe in MARKETDATA_TIMEFRAMES:
+        claimed = jobs.loc[jobs["Timeframe"] == timeframe, "TradeId"]
+        coverage[timeframe] = ~coverage["TradeId"].isin(claimed)
+    return coverage
+
+
+def run_fetch_worker(project_config, database_config, client_id=None):
+    """
+    Drain the fetch_jobs queue:
+    - Claim a batch of jobs (other workers skip them, trades of an open session wait)
+    - Fetch the claimed timeframes
+    - Mark each job done or failed from the coverage after the fetch
+    Stops when nothing is claimable, or when a whole batch failed (e.g. IB is down)
+    so retries are not used up in a tight loop.
+    Several workers can run at once, each with its own IB clientId.
+    Returns the number of jobs processed.
+    """
+    if client_id is not None:
+        project_config = {
+            **project_config,
+            'ib_connection': {**project_config['ib_connection'], 'clientId': client_id}
+        }
+
+    jobs_config = project_config.get('fetch_jobs', {})
+    storage_mode = project_config.get('storage', {}).get('mode', 'per_trade')
+    worker = worker_name(project_config['ib_connection']['clientId'])
+    exchange_tz, _ = configured_timezones(project_config.get('timezones'))
+
+    processed = 0
+    while True:
+        jobs = claim_fetch_jobs(
+            database_config, worker,
+            limit=jobs_config.get('claim_size', 50),
+            max_attempts=jobs_config.get('max_attempts', 3),
+            stale_seconds=jobs_config.get('stale_seconds', 3600),
+            exchange_timezone=exchange_tz
+        )
+        if jobs.empty:
+            break
+
+        my_trades = jobs[["TradeId", "Symbol", "Date"]].drop_duplicates(subset="TradeId").reset_index(drop=True)
+        print(f"\n{worker} claimed {len(jobs)} fetch jobs for {len(my_trades)} trades")
+
+        try:
+            ensure_intraday_partitions(database_config, my_trades["Date"])
+            # fetch_trade_data reports connection and fetch failures instead of raising
+            error = fetch_trade_data(my_trades, project_config, database_config, claimed_coverage(jobs))
+        except Exception as e:
+            error = str(e)
+            print(f"Fetch worker error: {e}")
+
+        coverage = fetch_marketdata_coverage(my_trades["TradeId"].tolist(), database_config, storage_mode)
+        done = finish_fetch_jobs(jobs, coverage, database_config, error)
+        processed += len(jobs)
+
+        if done == 0:
+            print(f"{worker}: no job of the batch succeeded, stopping.")
+            break
+
+    print(f"{worker}: {processed} fetch jobs processed.")
+    return processed
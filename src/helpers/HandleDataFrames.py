@@ -1,8 +1,15 @@
 from common.Calculate import *
-from common.AdjustTimezone import adjust_timezone_IB_data
+from common.AdjustTimezone import adjust_timezone_IB_series, configured_timezones
+from common.Instrumentation import instrumented
 from database.DBfunctions import *
 
 
+def local_bar_times(dates, timezones=None):
+    """IB bar dates as local "%Y-%m-%d %H:%M" strings, zones from the timezones config section."""
+    source_tz, local_tz = configured_timezones(timezones)
+    return adjust_timezone_IB_series(dates, source_tz=source_tz, local_tz=local_tz)
+
+
 def prepare_bars_dataframe(bars_df, symbol):
     """
     Clean incoming DataFrame:
@@ -78,12 +85,13 @@ def handle_incoming_dataframe_daily(
 def handle_incoming_dataframe_midterm(
     bars_df: pd.DataFrame, 
     symbol: str, 
-    trade_id: int
+    trade_id: int,
+    timezones: dict | None = None
 ) -> pd.DataFrame | None:
     """
     Process midterm bars:
     - Clean using prepare_bars_dataframe
-    - Adjust timezone on Date column
+    - Adjust timezone on Date column (timezones section of config.json)
     - Calculate EMA65
     - Add TradeId
     """
@@ -96,7 +104,7 @@ def handle_incoming_dataframe_midterm(
 
         # Step 2: Apply timezone adjustment to 'Date' (capitalized by prepare_bars_dataframe)
         if 'Date' in df.columns:
-            df['Date'] = df['Date'].apply(adjust_timezone_IB_data)
+            df['Date'] = local_bar_times(df['Date'], timezones)
 
         # Step 3: Calculate EMA65
         df = calculate_ema(df, 65)
@@ -117,12 +125,13 @@ def handle_incoming_dataframe_midterm(
 def handle_incoming_dataframe_intraday(
     bars_df: pd.DataFrame, 
     symbol: str, 
-    trade_id: int
+    trade_id: int,
+    timezones: dict | None = None
 ) -> pd.DataFrame | None:
     """
     Process intraday bars:
     - Clean using prepare_bars_dataframe
-    - Adjust timezone on Date column
+    - Adjust timezone on Date column (timezones section of config.json)
     - Calculate VWAP and EMA9
     - Split Date into Date and Time
     - Add TradeId
@@ -136,7 +145,7 @@ def handle_incoming_dataframe_intraday(
 
         # Step 2: Apply timezone adjustment to 'Date' column
         if 'Date' in df.columns:
-            df['Date'] = df['Date'].apply(adjust_timezone_IB_data)
+            df['Date'] = local_bar_times(df['Date'], timezones)
 
         # Step 3: Calculate indicators
         df = calculate_vwap(df)
@@ -196,4 +205,197 @@ def handle_incoming_dataframe_atr(
 
     except Exception as e:
         print(f"[ATR Handler] Error processing symbol {symbol}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# Batch variants: long-format frames of bars for many trades keyed by TradeId.
+# Cleaning, timezone conversion and the common/Calculate indicators (grouped
+# by TradeId) run once per batch. When a batch fails it is redone per trade,
+# so a failing trade is dropped alone.
+
+def prepare_bars_batch(bars_df):
+    """
+    Clean a long-format bars DataFrame (IB columns plus Symbol and TradeId):
+    - Drop unwanted columns
+    - Capitalize IB column names
+    - Sort by TradeId keeping bar order
+    Returns cleaned DataFrame or None if empty/error.
+    """
+    try:
+        if bars_df is None or bars_df.empty:
+            print("prepare_bars_batch: received empty DataFrame")
+            return None
+
+        df = bars_df.drop(columns=[col for col in ['average', 'barCount'] if col in bars_df.columns])
+        df = df.rename(columns={col: col.capitalize() for col in df.columns if col.islower()})
+        df = df.sort_values('TradeId', kind='stable').reset_index(drop=True)
+
+        return df
+
+    except Exception as e:
+        print(f"prepare_bars_batch: error preparing DataFrame: {e}")
+        return None
+
+
+def per_trade(df, calculate, label="Batch Handler"):
+    """
+    Fallback for a failed batch: apply calculate to each TradeId's bars separately.
+    A trade whose calculation fails is reported and left out, the others are kept.
+    Returns None when no trade could be processed.
+    """
+    results = []
+    for trade_id, bars in df.groupby('TradeId', sort=False):
+        try:
+            results.append(calculate(bars.copy()))
+        except Exception as e:
+            print(f"[{label}] Error processing TradeId {trade_id}: {e}")
+
+    return pd.concat(results, ignore_index=True) if results else None
+
+
+def local_bar_times_batch(df, timezones=None, label="Batch Handler"):
+    """
+    Convert the Date column of the whole batch in one operation. When that fails
+    the batch is converted per trade, so only the trades with bad dates are dropped.
+    """
+    try:
+        return df.assign(Date=local_bar_times(df['Date'], timezones))
+    except Exception as e:
+        print(f"[{label}] Timezone conversion failed for the batch ({e}), converting per trade")
+        return per_trade(df, lambda bars: bars.assign(Date=local_bar_times(bars['Date'], timezones)), label)
+
+
+def grouped_or_per_trade(df, calculate, label="Batch Handler"):
+    """
+    Run calculate(bars, by) once over the whole batch grouped by TradeId;
+    if that fails, run calculate(bars, None) per trade to isolate the bad trades.
+    """
+    try:
+        return calculate(df.copy(), 'TradeId')
+    except Exception as e:
+        print(f"[{label}] Grouped calculation failed ({e}), calculating per trade")
+        return per_trade(df, lambda bars: calculate(bars, None), label)
+
+
+def daily_indicators(df):
+    """5DayAvgVolume and RelativeVolume (calculate_rvol) per TradeId."""
+    return grouped_or_per_trade(df, lambda bars, by: calculate_rvol(bars, by=by), "Daily Indicators")
+
+
+def midterm_indicators(df):
+    """EMA65 (calculate_ema) per TradeId."""
+    return grouped_or_per_trade(df, lambda bars, by: calculate_ema(bars, 65, by=by), "Midterm Indicators")
+
+
+def intraday_indicators(df):
+    """VWAP (calculate_vwap) and EMA9 (calculate_ema) per TradeId."""
+    return grouped_or_per_trade(
+        df, lambda bars, by: calculate_ema(calculate_vwap(bars, by=by), 9, by=by), "Intraday Indicators"
+    )
+
+
+def atr_indicators(df):
+    """Prev_Close, TR and ATR (calculate_14day_atr) per TradeId."""
+    return grouped_or_per_trade(df, lambda bars, by: calculate_14day_atr(bars, by=by), "ATR Indicators")
+
+
+@instrumented("compute_daily_indicators")
+def handle_incoming_dataframes_daily_batch(bars_df: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Batch version of handle_incoming_dataframe_daily:
+    - RVOL per TradeId
+    """
+    try:
+        df = prepare_bars_batch(bars_df)
+        if df is None:
+            print("[Daily Batch Handler] No data")
+            return None
+
+        df = daily_indicators(df[['Symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'TradeId']])
+        if df is None:
+            return None
+
+        return df[['Symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume',
+                   '5DayAvgVolume', 'RelativeVolume', 'TradeId']]
+
+    except Exception as e:
+        print(f"[Daily Batch Handler] Error processing batch: {e}")
+        return None
+
+
+@instrumented("compute_midterm_indicators")
+def handle_incoming_dataframes_midterm_batch(bars_df: pd.DataFrame, timezones: dict | None = None) -> pd.DataFrame | None:
+    """
+    Batch version of handle_incoming_dataframe_midterm:
+    - One timezone conversion for the whole Date column
+    - EMA65 per TradeId
+    """
+    try:
+        df = prepare_bars_batch(bars_df)
+        if df is None:
+            print("[Midterm Batch Handler] No data")
+            return None
+
+        df = local_bar_times_batch(df, timezones, "Midterm Batch Handler")
+        df = midterm_indicators(df) if df is not None else None
+        if df is None:
+            return None
+
+        return df[['Symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'EMA65', 'TradeId']]
+
+    except Exception as e:
+        print(f"[Midterm Batch Handler] Error processing batch: {e}")
+        return None
+
+
+@instrumented("compute_intraday_indicators")
+def handle_incoming_dataframes_intraday_batch(bars_df: pd.DataFrame, timezones: dict | None = None) -> pd.DataFrame | None:
+    """
+    Batch version of handle_incoming_dataframe_intraday:
+    - One timezone conversion for the whole Date column
+    - VWAP and EMA9 per TradeId
+    - Split Date into Date and Time
+    """
+    try:
+        df = prepare_bars_batch(bars_df)
+        if df is None:
+            print("[Intraday Batch Handler] No data")
+            return None
+
+        df = local_bar_times_batch(df, timezones, "Intraday Batch Handler")
+        df = intraday_indicators(df) if df is not None else None
+        if df is None:
+            return None
+
+        df[['Date', 'Time']] = df['Date'].str.split(' ', expand=True)
+
+        return df[['Symbol', 'Date', 'Time', 'Open', 'High', 'Low', 'Close',
+                   'Volume', 'VWAP', 'EMA9', 'TradeId']]
+
+    except Exception as e:
+        print(f"[Intraday Batch Handler] Error processing batch: {e}")
+        return None
+
+
+@instrumented("compute_atr")
+def handle_incoming_dataframes_atr_batch(bars_df: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Batch version of handle_incoming_dataframe_atr:
+    - True Range and ATR per TradeId
+    """
+    try:
+        df = prepare_bars_batch(bars_df)
+        if df is None:
+            print("[ATR Batch Handler] No data")
+            return None
+
+        df = atr_indicators(df[['Symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'TradeId']])
+        if df is None:
+            return None
+
+        return df[['Symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume',
+                   'Prev_Close', 'TR', 'ATR', 'TradeId']]
+
+    except Exception as e:
+        print(f"[ATR Batch Handler] Error processing batch: {e}")
+        return None
@@ -1,31 +1,48 @@
-from common.AdjustTimezone import adjust_timezone_transactions
-from database.DBfunctions import *  
+from common.AdjustTimezone import adjust_timezone_transactions_frame, configured_timezones
+from database.DBfunctions import *
+from common.Instrumentation import instrumented
 import os
 import shutil
 
 
 
+def move_tlg_file(file_path, target_folder):
+    """
+    Move a processed .tlg file into the given folder.
+    """
+    filename = os.path.basename(file_path)
+    shutil.move(file_path, os.path.join(target_folder, filename))
+    return filename
+
+
+@instrumented("store_executions")
+def store_executions(transactions_df, database_config, timezones=None):
+    """
+    Adjusts transaction dates and times to the local zone and bulk inserts them into the database.
+    Raises on database errors so the caller can decide what to do with the source.
+    """
+    source_tz, local_tz = configured_timezones(timezones)
+    local_df = adjust_timezone_transactions_frame(transactions_df, source_tz=source_tz, local_tz=local_tz)
+    insert_executions_to_db(local_df, database_config)
 
 
+@instrumented("handle_executions")
 def handle_executions(transactions_df,  file_path, project_config,database_config):
     """
     Adjusts transaction times, bulk inserts into the database.
     Moves the .tlg file to 'out' folder on success, 'error' folder on failure.
     """
-    transactions_df['Time'] = transactions_df['Time'].apply(adjust_timezone_transactions)
-
     out_folder = project_config['folders']['out']
     error_folder = project_config['folders']['error']
-    filename = os.path.basename(file_path)
 
     try:
-        insert_executions_to_db(transactions_df, database_config)
- 
+        store_executions(transactions_df, database_config, project_config.get('timezones'))
+
         # Move file to out folder
-        shutil.move(file_path, os.path.join(out_folder, filename))
+        filename = move_tlg_file(file_path, out_folder)
         print(f"Moved {filename} to {out_folder}")
     except Exception as e:
 
         # Move file to error folder
-        shutil.move(file_path, os.path.join(error_folder, filename))
-        print(f"Bulk insert failed: {e}. Moved {filename} to {error_folder}")
\ No newline at end of file
+        filename = move_tlg_file(file_path, error_folder)
+        print(f"Bulk insert failed: {e}. Moved {filename} to {error_folder}")
@@ -0,0 +1,235 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import pandas as pd
+from ib_insync import Stock
+
+from helpers.BarCache import BarCache
+from common.Instrumentation import add_requests
+
+
+@dataclass(frozen=True)
+class HistoricalRequest:
+    """One reqHistoricalData call, also used as identity for pacing."""
+    symbol: str
+    end_date_time: str
+    duration: str
+    bar_size: str
+    what_to_show: str = "TRADES"
+    use_rth: bool = False
+    primary_exchange: str | None = "ARCA"
+    format_date: int = 1
+
+    def contract(self):
+        contract = Stock(self.symbol, 'SMART', 'USD')
+        if self.primary_exchange:
+            contract.primaryExchange = self.primary_exchange
+        return contract
+
+
+class SlidingWindow:
+    """
+    Send times of the last `limit` requests, for rules like IB's
+    "max 60 historical requests per 10 minutes": a request may go out
+    once fewer than `limit` requests were sent in the past `window_seconds`.
+    """
+
+    def __init__(self, limit=60, window_seconds=600):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.times = deque()
+
+    def wait_time(self, now):
+        """Seconds until the next request fits in the window, 0 if it fits now."""
+        while self.times and now - self.times[0] >= self.window_seconds:
+            self.times.popleft()
+        if len(self.times) < self.limit:
+            return 0.0
+        return self.times[0] + self.window_seconds - now
+
+    def record(self, now):
+        self.times.append(now)
+
+
+class HistoricalDataScheduler:
+    """
+    Keeps several reqHistoricalData requests in flight on ib_insync's async API
+    while enforcing IB historical data pacing:
+    - at most `requests_per_window` requests per `window_seconds` (sliding window)
+    - no identical request within `identical_interval` seconds
+    - at most 6 requests for the same contract within 2 seconds
+    Pacing violations (error 162) are retried with exponential backoff.
+    An optional BarCache is consulted before each request and filled after it.
+    With paced=False (replaying recorded responses) the pacing rules are skipped.
+    """
+
+    PACING_ERROR_CODE = 162
+
+    def __init__(self, ib, max_in_flight=4, requests_per_window=60, window_seconds=600,
+                 identical_interval=15, max_retries=3, backoff_seconds=15, timeout=60, cache=None,
+                 paced=True):
+        self.ib = ib
+        self.cache = cache
+        self.paced = paced
+        self.max_in_flight = max_in_flight
+        self.window = SlidingWindow(requests_per_window, window_seconds)
+        self.identical_interval = identical_interval
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+
+        self._last_identical = {}
+        self._contract_times = {}
+        self._pacing_errors = {}
+
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.started = None
+
+        self.ib.errorEvent += self._on_error
+
+    @classmethod
+    def from_config(cls, ib, project_config):
+        """
+        Build a scheduler from the optional ib_pacing and bar_cache sections of config.json.
+        Replayed responses (ib_replay mode "replay") never reach IB, so they are not paced.
+        """
+        paced = project_config.get('ib_replay', {}).get('mode', 'off') != 'replay'
+        return cls(ib, cache=BarCache.from_config(project_config), paced=paced,
+                   **project_config.get('ib_pacing', {}))
+
+    def _on_error(self, reqId, errorCode, errorString, contract):
+        if errorCode == self.PACING_ERROR_CODE and 'pacing' in errorString.lower():
+            symbol = getattr(contract, 'symbol', None)
+            self._pacing_errors[symbol] = time.monotonic()
+
+    async def _wait_for_pacing(self, request):
+        """
+        Wait until the request satisfies every pacing rule, then claim its slot.
+        All rules are rechecked after each wait, and the slot is recorded without
+        awaiting in between, so concurrent coroutines cannot pass the same check.
+        """
+        if not self.paced:
+            return
+
+        # Max 6 requests for the same contract within 2 seconds
+        contract_window = self._contract_times.setdefault(request.symbol, SlidingWindow(6, 2))
+
+        while True:
+            now = time.monotonic()
+            wait = max(
+                # Identical requests must be at least identical_interval seconds apart
+                self.identical_interval - (now - self._last_identical.get(request, float('-inf'))),
+                contract_window.wait_time(now),
+                self.window.wait_time(now),
+            )
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        self._last_identical[request] = now
+        contract_window.record(now)
+        self.window.record(now)
+
+    async def _fetch_one(self, request, semaphore):
+        if self.cache is not None:
+            cached = self.cache.get(request)
+            if cached is not None:
+                self.queued -= 1
+                self.cache_hits += 1
+                return cached
+
+        async with semaphore:
+            self.queued -= 1
+            for attempt in range(self.max_retries + 1):
+                await self._wait_for_pacing(request)
+                sent = time.monotonic()
+                self.in_flight += 1
+                add_requests()
+                try:
+                    bars = await self.ib.reqHistoricalDataAsync(
+                        request.contract(),
+                        endDateTime=request.end_date_time,
+                        durationStr=request.duration,
+                        barSizeSetting=request.bar_size,
+                        whatToShow=request.what_to_show,
+                        useRTH=request.use_rth,
+                        formatDate=request.format_date,
+                        timeout=self.timeout
+                    )
+                except Exception as e:
+                    print(f"Failed to fetch data for {request.symbol} on {request.end_date_time}. Error: {e}")
+                    bars = []
+                finally:
+                    self.in_flight -= 1
+
+                if bars:
+                    self.completed += 1
+                    bars_df = pd.DataFrame(bars)
+                    if self.cache is not None:
+                        self.cache.put(request, bars_df)
+                    return bars_df
+
+                paced = self._pacing_errors.get(request.symbol, 0) >= sent
+                if not paced or attempt == self.max_retries:
+                    break
+
+                backoff = self.backoff_seconds * (2 ** attempt)
+                self.retries += 1
+                print(f"Pacing violation for {request.symbol}, retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+
+            self.failed += 1
+            print(f"No data returned for {request.symbol} on {request.end_date_time}")
+            return pd.DataFrame()
+
+    async def fetch_all_async(self, requests):
+        """
+        Fetch all requests concurrently. Identical requests are sent once.
+        Returns DataFrames in request order.
+        """
+        if self.started is None:
+            self.started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        unique_requests = list(dict.fromkeys(requests))
+        self.queued += len(unique_requests)
+        frames = await asyncio.gather(*(self._fetch_one(request, semaphore) for request in unique_requests))
+
+        by_request = dict(zip(unique_requests, frames))
+        return [by_request[request] for request in requests]
+
+    def fetch_all(self, requests):
+        """Blocking wrapper around fetch_all_async using the IB event loop."""
+        if not requests:
+            return []
+        frames = self.ib.run(self.fetch_all_async(list(requests)))
+        self.report()
+        return list(frames)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "requests_per_minute": round(self.completed / elapsed * 60, 2) if elapsed else 0.0
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"IB scheduler: queue={stats['queue_depth']} in_flight={stats['in_flight']} "
+            f"completed={stats['completed']} failed={stats['failed']} retries={stats['retries']} "
+            f"cache_hits={stats['cache_hits']} "
+            f"throughput={stats['requests_per_minute']} req/min"
+        )
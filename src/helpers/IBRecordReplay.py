@@ -0,0 +1,219 @@
+import asyncio
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+from ib_insync import IB, BarData
+
+
+# Record/replay layer for IB historical data.
+# - record: RecordingIB wraps a live IB and stores every reqHistoricalData response
+# - replay: ReplayIB serves the stored responses without TWS/Gateway
+# Both expose the parts of the IB API the fetchers and HistoricalDataScheduler use.
+
+class HistoricalArchive:
+    """
+    Folder of gzip-pickled bar lists keyed by the request parameters,
+    with an index.json describing each recorded request.
+    While recording, new entries are appended to index.jsonl and merged into
+    index.json by save_index() (called when the recording client disconnects).
+    """
+
+    INDEX_FILE = "index.json"
+    JOURNAL_FILE = "index.jsonl"
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        index = {}
+        path = os.path.join(self.folder, self.INDEX_FILE)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                index = json.load(f)
+
+        # Entries of a recording that ended without save_index()
+        journal_path = os.path.join(self.folder, self.JOURNAL_FILE)
+        if os.path.exists(journal_path):
+            with open(journal_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        index[entry.pop("key")] = entry
+        return index
+
+    def save_index(self):
+        """Write the whole index to index.json once and drop the append journal."""
+        with self._lock:
+            path = os.path.join(self.folder, self.INDEX_FILE)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._index, f, indent=1)
+            os.replace(tmp_path, path)
+            try:
+                os.remove(os.path.join(self.folder, self.JOURNAL_FILE))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def request_identity(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, formatDate=1):
+        end = endDateTime.strftime("%Y%m%d %H:%M:%S") if hasattr(endDateTime, "strftime") else str(endDateTime)
+        return {
+            "symbol": contract.symbol,
+            "primary_exchange": getattr(contract, "primaryExchange", "") or "",
+            "end_date_time": end,
+            "duration": durationStr,
+            "bar_size": barSizeSetting,
+            "what_to_show": whatToShow,
+            "use_rth": bool(useRTH),
+            "format_date": int(formatDate)
+        }
+
+    @staticmethod
+    def key(identity):
+        return hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()[:20]
+
+    def put(self, identity, bars):
+        key = self.key(identity)
+        rows = [dataclasses.asdict(bar) if dataclasses.is_dataclass(bar) else dict(bar) for bar in bars]
+        with self._lock:
+            with gzip.open(os.path.join(self.folder, f"{key}.pkl.gz"), 'wb') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            entry = {**identity, "bars": len(rows), "recorded": time.time()}
+            self._index[key] = entry
+            # Append one line instead of rewriting the index for every response
+            with open(os.path.join(self.folder, self.JOURNAL_FILE), 'a') as f:
+                f.write(json.dumps({"key": key, **entry}) + "\n")
+
+    def get(self, identity):
+        """Recorded bars as BarData objects, None if the request was never recorded."""
+        key = self.key(identity)
+        if key not in self._index:
+            return None
+        with gzip.open(os.path.join(self.folder, f"{key}.pkl.gz"), 'rb') as f:
+            rows = pickle.load(f)
+        return [BarData(**row) for row in rows]
+
+    def __len__(self):
+        return len(self._index)
+
+
+class RecordingIB:
+    """Live IB client that records every historical data response into the archive."""
+
+    def __init__(self, ib, archive):
+        self._ib = ib
+        self.archive = archive
+
+    def __getattr__(self, name):
+        return getattr(self._ib, name)
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting,
+                                     whatToShow, useRTH, formatDate=1, **kwargs):
+        bars = await self._ib.reqHistoricalDataAsync(
+            contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, formatDate, **kwargs
+        )
+        if bars:
+            identity = HistoricalArchive.request_identity(
+                contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, formatDate
+            )
+            self.archive.put(identity, bars)
+        return bars
+
+    def reqHistoricalData(self, *args, **kwargs):
+        return self._ib.run(self.reqHistoricalDataAsync(*args, **kwargs))
+
+    def disconnect(self):
+        self.archive.save_index()
+        return self._ib.disconnect()
+
+
+class _ReplayEvent:
+    """Stand-in for IB events: handlers can be added and removed, nothing is emitted."""
+
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+        return self
+
+
+class ReplayIB:
+    """
+    Offline IB client serving historical data from the archive.
+    latency_ms is slept before each response to mimic round-trip time.
+    Requests missing from the archive return no bars.
+    """
+
+    def __init__(self, archive, latency_ms=0):
+        self.archive = archive
+        self.latency = latency_ms / 1000
+        self.errorEvent = _ReplayEvent()
+        self.replayed = 0
+        self.missing = 0
+        self._connected = False
+
+    def connect(self, host=None, port=None, clientId=None, **kwargs):
+        self._connected = True
+        print(f"Replaying IB historical data from {self.archive.folder} ({len(self.archive)} recorded requests)")
+        return self
+
+    def isConnected(self):
+        return self._connected
+
+    def disconnect(self):
+        if self._connected:
+            print(f"Replay finished: {self.replayed} served, {self.missing} not in archive")
+        self._connected = False
+
+    def run(self, awaitable):
+        return asyncio.run(awaitable)
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting,
+                                     whatToShow, useRTH, formatDate=1, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        identity = HistoricalArchive.request_identity(
+            contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, formatDate
+        )
+        bars = self.archive.get(identity)
+        if bars is None:
+            self.missing += 1
+            print(f"No recorded response for {identity['symbol']} {identity['bar_size']} "
+                  f"{identity['duration']} ending {identity['end_date_time']}")
+            return []
+        self.replayed += 1
+        return bars
+
+    def reqHistoricalData(self, *args, **kwargs):
+        return self.run(self.reqHistoricalDataAsync(*args, **kwargs))
+
+
+def create_ib_client(project_config):
+    """
+    IB client for the ib_replay section of config.json:
+    mode "record" wraps a live IB, "replay" serves the archive, anything else is a plain IB().
+    In replay mode HistoricalDataScheduler.from_config skips IB pacing.
+    """
+    replay_config = project_config.get('ib_replay', {})
+    mode = replay_config.get('mode', 'off')
+
+    if mode == 'replay':
+        return ReplayIB(HistoricalArchive(replay_config['archive']), replay_config.get('latency_ms', 0))
+    if mode == 'record':
+        return RecordingIB(IB(), HistoricalArchive(replay_config['archive']))
+    return IB()
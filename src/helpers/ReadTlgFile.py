@@ -1,29 +1,130 @@
 import pandas as pd
 import glob
+import csv
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 
+from common.Instrumentation import instrumented
 
-def read_tlg_file(data_in_folder):
 
-    # Find the single .tlg file in the folder
-    file_paths = glob.glob(f"{data_in_folder}/*.tlg")
-    if not file_paths:
-        print(f"\nNo .tlg file found in {data_in_folder}. Returning empty DataFrame.")
-        return {}, pd.DataFrame(), None
+# Column layout of a STK_TRD line (record type is the first field)
+TLG_COLUMNS = [
+    "Record", "TransactionID", "Ticker", "CompanyName", "Venue", "Action",
+    "OrderType", "Date", "Time", "Currency", "Quantity", "Multiplier",
+    "Price", "Amount", "Fee", "Extra"
+]
 
-    file_path = file_paths[0]  # Assumes exactly one .tlg file exists
+# Fixed dtypes so every parsed chunk has the same columnar layout.
+# Text columns stay str: categories inferred per chunk differ and concat turns them into object.
+TLG_DTYPES = {
+    "TransactionID": "str",
+    "Ticker": "str",
+    "CompanyName": "str",
+    "Venue": "str",
+    "Action": "str",
+    "OrderType": "str",
+    "Date": "str",
+    "Time": "str",
+    "Currency": "str",
+    "Quantity": "float64",
+    "Multiplier": "float64",
+    "Price": "float64",
+    "Amount": "float64",
+    "Fee": "float64",
+    "Extra": "str"
+}
+
+# Section headers; ACT_INF lines count in ACCOUNT_INFORMATION, STK_TRD lines in STOCK_TRANSACTIONS
+SECTION_PATTERN = re.compile(r"^(ACCOUNT_INFORMATION|STOCK_TRANSACTIONS).*$", re.MULTILINE)
+ACT_INF_PATTERN = re.compile(r"^ACT_INF\|.*$", re.MULTILINE)
+STK_TRD_PATTERN = re.compile(r"^STK_TRD\|.*$", re.MULTILINE)
+
+
+def parse_account_info(line):
+    """
+    Parse an ACT_INF line into the account info dict.
+    """
+    parts = line.strip().split("|")
+    return {
+        "Account ID": parts[1],
+        "Name": parts[2],
+        "Type": parts[3],
+        "Address": parts[4]
+    }
+
+
+def parse_stk_trd_lines(lines):
+    """
+    Parse raw STK_TRD lines with the vectorized delimiter parser.
+    Fields past the Extra column are ignored, as in the line-by-line reader.
+    Returns a DataFrame with TLG_DTYPES applied (without the Record column).
+    """
+    if not lines:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in TLG_DTYPES.items()})
 
-    # Initialize containers
+    # The delimiter parser rejects (or shifts columns on) lines with more fields
+    # than TLG_COLUMNS, so only those lines are cut down to the known layout
+    max_separators = len(TLG_COLUMNS) - 1
+    lines = [
+        "|".join(line.split("|", len(TLG_COLUMNS))[:len(TLG_COLUMNS)])
+        if line.count("|") > max_separators else line
+        for line in lines
+    ]
+
+    df = pd.read_csv(
+        io.StringIO("\n".join(lines)),
+        sep="|",
+        header=None,
+        names=TLG_COLUMNS,
+        dtype=TLG_DTYPES,
+        quoting=csv.QUOTE_NONE,
+        keep_default_na=False,
+        engine="c"
+    )
+    return df.drop(columns=["Record"])
+
+
+def parse_tlg_file(file_path):
+    """
+    Whole-file fast path:
+    - Read the file once
+    - Split it into sections and filter STK_TRD lines with a regex instead of a Python loop
+    - Hand them to the vectorized delimiter parser
+    Uses the same section rules as iter_tlg_chunks.
+    Returns (account_info, transactions_df).
+    """
+    with open(file_path, 'r', encoding='latin1') as file:
+        content = file.read()
+
+    # [preamble, header, text, header, text, ...]; text before the first header belongs to no section
+    parts = SECTION_PATTERN.split(content)
     account_info = {}
-    transactions = []
+    lines = []
+    for section, text in zip(parts[1::2], parts[2::2]):
+        if section == "ACCOUNT_INFORMATION":
+            for account_line in ACT_INF_PATTERN.findall(text):
+                account_info = parse_account_info(account_line.rstrip("\r"))
+        else:
+            lines.extend(line.rstrip("\r") for line in STK_TRD_PATTERN.findall(text))
+
+    return account_info, parse_stk_trd_lines(lines)
 
-    # State variable to track the section
+
+def iter_tlg_chunks(file_path, chunksize=50000):
+    """
+    Streaming parser mode for large multi-year logs (Main --stream).
+    Yields (account_info, transactions_df) with typed, columnar DataFrames of at most
+    `chunksize` STK_TRD rows, so memory stays bounded by the chunk size instead of the file size.
+    Uses the same section rules as parse_tlg_file.
+    """
+    account_info = {}
+    buffer = []
     current_section = None
 
-    # Read the file line by line
     with open(file_path, 'r', encoding='latin1') as file:
         for line in file:
-            line = line.strip()
-
             if line.startswith("ACCOUNT_INFORMATION"):
                 current_section = "ACCOUNT_INFORMATION"
                 continue
@@ -31,36 +132,80 @@ def read_tlg_file(data_in_folder):
                 current_section = "STOCK_TRANSACTIONS"
                 continue
 
-            if current_section == "ACCOUNT_INFORMATION" and line.startswith("ACT_INF"):
-                parts = line.split("|")
-                account_info = {
-                    "Account ID": parts[1],
-                    "Name": parts[2],
-                    "Type": parts[3],
-                    "Address": parts[4]
-                }
-            elif current_section == "STOCK_TRANSACTIONS" and line.startswith("STK_TRD"):
-                parts = line.split("|")
-                transaction = {
-                    "TransactionID": parts[1],
-                    "Ticker": parts[2],
-                    "CompanyName": parts[3],
-                    "Venue": parts[4],
-                    "Action": parts[5],
-                    "OrderType": parts[6],
-                    "Date": parts[7],
-                    "Time": parts[8],
-                    "Currency": parts[9],
-                    "Quantity": float(parts[10]),
-                    "Multiplier": float(parts[11]),
-                    "Price": float(parts[12]),
-                    "Amount": float(parts[13]),
-                    "Fee": float(parts[14]),
-                    "Extra": parts[15]
-                }
-                transactions.append(transaction)
-
-    # Convert transactions to a DataFrame
-    transactions_df = pd.DataFrame(transactions)
+            if current_section == "ACCOUNT_INFORMATION" and line.startswith("ACT_INF|"):
+                account_info = parse_account_info(line.rstrip("\r\n"))
+            elif current_section == "STOCK_TRANSACTIONS" and line.startswith("STK_TRD|"):
+                buffer.append(line.rstrip("\r\n"))
+                if len(buffer) >= chunksize:
+                    yield account_info, parse_stk_trd_lines(buffer)
+                    buffer = []
+
+    if buffer:
+        yield account_info, parse_stk_trd_lines(buffer)
+
+
+@instrumented("read_tlg_file", rows=lambda result, *args, **kwargs: len(result[1]))
+def read_tlg_file(data_in_folder):
+
+    # Find the single .tlg file in the folder
+    file_paths = glob.glob(f"{data_in_folder}/*.tlg")
+    if not file_paths:
+        print(f"\nNo .tlg file found in {data_in_folder}. Returning empty DataFrame.")
+        return {}, pd.DataFrame(), None
+
+    file_path = file_paths[0]  # Assumes exactly one .tlg file exists
+
+    account_info, transactions_df = parse_tlg_file(file_path)
 
     return account_info, transactions_df, file_path
+
+
+@instrumented("read_tlg_files", rows=lambda result, *args, **kwargs: len(result[1]))
+def read_tlg_files(data_in_folder, max_workers=None):
+    """
+    Batch ingest mode:
+    - Discover every .tlg file in the folder
+    - Parse them concurrently in a process pool
+    - Merge and de-duplicate executions by TransactionID across files
+    Returns (account_info, transactions_df, file_frames, failed_files) where
+    file_frames is a list of (file_path, DataFrame) holding the executions first
+    seen in that file, so each file can be moved to out/error individually.
+    """
+    file_paths = sorted(glob.glob(f"{data_in_folder}/*.tlg"))
+    if not file_paths:
+        print(f"\nNo .tlg file found in {data_in_folder}. Returning empty DataFrame.")
+        return {}, pd.DataFrame(), [], []
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(file_paths))
+
+    account_info = {}
+    parsed = []
+    failed_files = []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(file_path, executor.submit(parse_tlg_file, file_path)) for file_path in file_paths]
+        for file_path, future in futures:
+            try:
+                file_account_info, file_df = future.result()
+            except Exception as e:
+                print(f"Failed to parse {os.path.basename(file_path)}: {e}")
+                failed_files.append(file_path)
+                continue
+
+            account_info = account_info or file_account_info
+            parsed.append((file_path, file_df.assign(SourceFile=file_path)))
+
+    if not parsed:
+        return account_info, pd.DataFrame(), [], failed_files
+
+    # Keep the first occurrence of each execution across all files
+    merged = pd.concat([df for _, df in parsed], ignore_index=True)
+    merged = merged.drop_duplicates(subset="TransactionID", keep="first")
+
+    file_frames = [
+        (file_path, merged[merged["SourceFile"] == file_path].drop(columns=["SourceFile"]).reset_index(drop=True))
+        for file_path, _ in parsed
+    ]
+    transactions_df = merged.drop(columns=["SourceFile"]).reset_index(drop=True)
+
+    return account_info, transactions_df, file_frames, failed_files
@@ -0,0 +1,92 @@
+from common.Calculate import calculate_relatr
+from common.Instrumentation import instrumented
+from database.DBfunctions import (
+    RECOMPUTE_TABLES, stream_marketdata, fetch_prior_daily_bars, update_indicator_columns
+)
+from helpers.HandleDataFrames import (
+    prepare_bars_batch, daily_indicators, midterm_indicators, intraday_indicators,
+    handle_incoming_dataframes_atr_batch
+)
+
+
+# Stored bars are already in local time (and intraday split into Date/Time),
+# so only the indicator step of the batch handlers is rerun on them. Both use
+# the same common/Calculate functions, so a changed indicator is picked up here.
+
+def recompute_daily(bars_df, database_config):
+    df = prepare_bars_batch(bars_df)
+    return daily_indicators(df) if df is not None else None
+
+
+def recompute_midterm(bars_df, database_config):
+    df = prepare_bars_batch(bars_df)
+    return midterm_indicators(df) if df is not None else None
+
+
+def recompute_intraday(bars_df, database_config):
+    """
+    VWAP and EMA9 from the stored bars, Relatr from the ATR of each trade's
+    stored daily bars before the trade date. Trades without those keep their stored Relatr.
+    """
+    df = prepare_bars_batch(bars_df)
+    if df is None:
+        return None
+
+    stored_relatr = df['Relatr']
+    df = intraday_indicators(df)
+
+    atr_df = handle_incoming_dataframes_atr_batch(
+        fetch_prior_daily_bars(df['TradeId'].unique().tolist(), database_config)
+    )
+    if atr_df is None:
+        return df.assign(Relatr=stored_relatr)
+
+    has_atr = df['TradeId'].isin(atr_df['TradeId'])
+    df = calculate_relatr(df, atr_df)
+    return df.assign(Relatr=df['Relatr'].where(has_atr, stored_relatr))
+
+
+RECOMPUTERS = {
+    "daily": recompute_daily,
+    "30mins": recompute_midterm,
+    "intraday": recompute_intraday,
+}
+
+
+@instrumented("recompute_indicators", rows=lambda updated, *args, **kwargs: updated)
+def recompute_indicators(project_config, database_config, timeframes=None, trade_ids=None):
+    """
+    Recompute the indicator columns of stored market data without IB:
+    - Stream the stored bars in chunks of whole trades
+    - Rerun the indicator calculations on each chunk
+    - Write the indicator columns back with one bulk UPDATE per chunk
+    A failing timeframe does not stop the others; the run raises at the end.
+    Returns the number of updated rows.
+    """
+    storage_mode = project_config.get('storage', {}).get('mode', 'per_trade')
+    if storage_mode != "per_trade":
+        print("Recompute works on the per_trade market data tables, symbol storage mode is not supported.")
+        return 0
+
+    recompute_config = project_config.get('recompute', {})
+    chunk_trades = recompute_config.get('chunk_trades', 500)
+    fetch_size = recompute_config.get('fetch_size', 50000)
+
+    updated = 0
+    failed = []
+    for timeframe in timeframes or RECOMPUTE_TABLES:
+        table_updated = 0
+        try:
+            for bars_df in stream_marketdata(timeframe, database_config, trade_ids, chunk_trades, fetch_size):
+                data = RECOMPUTERS[timeframe](bars_df, database_config)
+                table_updated += update_indicator_columns(data, timeframe, database_config)
+        except Exception as e:
+            print(f"Recompute of {timeframe} indicators FAILED after {table_updated} rows: {e}")
+            failed.append(timeframe)
+        else:
+            print(f"Recomputed {timeframe} indicators: {table_updated} rows updated")
+        updated += table_updated
+
+    if failed:
+        raise RuntimeError(f"Recompute failed for {', '.join(failed)}, {updated} rows updated in total")
+    return updated
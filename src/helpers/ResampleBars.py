@@ -0,0 +1,115 @@
+import math
+
+import pandas as pd
+
+from common.AdjustTimezone import to_local_datetime, EXCHANGE_TIMEZONE
+
+
+# Derive coarser bars from finer ones locally instead of asking IB again.
+# in  = IB bars DataFrame (date, open, high, low, close, volume[, average, barCount])
+# out = the same layout, so derived bars go through the usual handlers unchanged
+
+RTH_START = "09:30"
+RTH_END = "16:00"
+
+BAR_SIZE_MINUTES = {"min": 1, "mins": 1, "hour": 60, "hours": 60}
+
+
+def bar_size_minutes(bar_size):
+    """Minutes in an IB bar size like '2 mins' or '1 hour', None for '1 day'."""
+    amount, unit = bar_size.split()
+    if unit.lower() in ("day", "days"):
+        return None
+    return int(amount) * BAR_SIZE_MINUTES[unit.lower()]
+
+
+def exchange_bar_times(bars_df, exchange_timezone=EXCHANGE_TIMEZONE):
+    """Bar start times as naive exchange time."""
+    return to_local_datetime(bars_df['date'], local_tz=exchange_timezone).dt.tz_localize(None)
+
+
+def regular_hours_mask(bar_times):
+    """True for bars that start within the regular session (09:30-16:00 exchange time)."""
+    minutes = bar_times.dt.hour * 60 + bar_times.dt.minute
+    start = int(RTH_START[:2]) * 60 + int(RTH_START[3:])
+    end = int(RTH_END[:2]) * 60 + int(RTH_END[3:])
+    return ((minutes >= start) & (minutes < end)).to_numpy()
+
+
+def resample_bars(bars_df, bar_size, use_rth=False, exchange_timezone=EXCHANGE_TIMEZONE):
+    """
+    Build bar_size OHLCV bars from finer bars.
+    - Buckets never cross a session (exchange date)
+    - use_rth keeps only regular hours bars and anchors buckets at 09:30,
+      otherwise buckets are aligned to the clock like IB's extended hours bars
+    - '1 day' gives one bar per session dated at the session date
+    Returns a DataFrame in IB bar layout, date in exchange time.
+    """
+    if bars_df is None or bars_df.empty:
+        return pd.DataFrame(columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+
+    bar_times = exchange_bar_times(bars_df, exchange_timezone)
+    bars = bars_df.assign(_time=bar_times.to_numpy())
+    if use_rth:
+        bars = bars[regular_hours_mask(bar_times)]
+    bars = bars.sort_values('_time', kind='stable')
+
+    sessions = bars['_time'].dt.normalize()
+    minutes = bar_size_minutes(bar_size)
+    if minutes is None:
+        buckets = sessions
+    else:
+        anchor = sessions + (pd.Timedelta(RTH_START + ":00") if use_rth else pd.Timedelta(0))
+        offset = (bars['_time'] - anchor) // pd.Timedelta(minutes=minutes)
+        buckets = anchor + offset * pd.Timedelta(minutes=minutes)
+
+    aggregations = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    if 'barCount' in bars.columns:
+        aggregations['barCount'] = 'sum'
+    if 'average' in bars.columns:
+        bars = bars.assign(_pv=bars['average'] * bars['volume'])
+        aggregations['_pv'] = 'sum'
+
+    grouped = bars.groupby(buckets.rename('date'), sort=True)
+    resampled = grouped.agg(aggregations).reset_index()
+    if 'average' in bars.columns:
+        volume = resampled['volume'].where(resampled['volume'] != 0)
+        last_close = pd.Series(grouped['close'].last().to_numpy(), index=resampled.index)
+        resampled['average'] = (resampled.pop('_pv') / volume).fillna(last_close)
+
+    if minutes is None:
+        resampled['date'] = resampled['date'].dt.date
+    else:
+        resampled['date'] = resampled['date'].dt.tz_localize(
+            exchange_timezone, ambiguous=True, nonexistent="shift_forward"
+        )
+    return resampled
+
+
+def chunk_count(total_days, chunk_days):
+    """Number of chunks chunk_end_dates returns, including the spare one."""
+    return max(1, math.ceil(total_days / chunk_days)) + 1
+
+
+def chunk_end_dates(last_date, total_days, chunk_days):
+    """
+    End dates (YYYYMMDD) of consecutive chunks that cover total_days trading
+    sessions back from last_date, newest first. IB counts 'D' durations in
+    sessions, so chunk ends step back by business days. Exchange holidays only
+    make chunks overlap; one spare chunk makes up for up to chunk_days of them.
+    """
+    last_date = pd.Timestamp(str(last_date))
+    return [
+        (last_date - pd.offsets.BDay(chunk_days * i)).strftime('%Y%m%d')
+        for i in range(chunk_count(total_days, chunk_days))
+    ]
+
+
+def combine_chunks(frames):
+    """Concatenate chunked IB series, dropping bars repeated where chunks overlap."""
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat(frames, ignore_index=True)
+    combined = combined.drop_duplicates(subset='date', keep='first')
+    return combined.sort_values('date', kind='stable').reset_index(drop=True)
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+
+from database.ConnectionPool import database_session
+from database.DBfunctions import store_marketdata
+
+
+class StagedPipeline:
+    """
+    IB fetch -> indicator compute -> DB write as overlapping stages.
+    - The caller thread fetches from IB (ib_insync's event loop lives there) and submits bars
+    - A compute thread runs the indicator handlers
+    - A writer thread stores the results in its own database session
+    Stages are connected by bounded queues, so a slow stage blocks the one
+    feeding it (backpressure) instead of buffering unbounded bars in memory.
+    """
+
+    _STOP = object()
+
+    def __init__(self, database_config, storage_mode="per_trade", queue_size=2):
+        self.database_config = database_config
+        self.storage_mode = storage_mode
+        self.compute_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        self.submitted = 0
+        self.computed = 0
+        self.written = 0
+        self.failed = 0
+        self.fetch_blocked_seconds = 0.0
+
+        self._threads = [
+            threading.Thread(target=self._compute_worker, name="pipeline-compute", daemon=True),
+            threading.Thread(target=self._write_worker, name="pipeline-write", daemon=True),
+        ]
+        self._started = False
+        self._write_done = False
+
+    @classmethod
+    def from_config(cls, database_config, project_config):
+        """Build the pipeline from the optional pipeline section of config.json."""
+        return cls(
+            database_config,
+            storage_mode=project_config.get('storage', {}).get('mode', 'per_trade'),
+            queue_size=project_config.get('pipeline', {}).get('queue_size', 2)
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        if not self._started:
+            for thread in self._threads:
+                thread.start()
+            self._started = True
+
+    def submit(self, timeframe, compute, *args, on_stored=None):
+        """
+        Queue bars for compute(*args) and storage as `timeframe`; blocks while the queue is full.
+        on_stored() is called by the writer once the result was stored completely.
+        """
+        start = time.perf_counter()
+        self.compute_queue.put((timeframe, compute, args, on_stored))
+        self.fetch_blocked_seconds += time.perf_counter() - start
+        self.submitted += 1
+
+    def _compute_worker(self):
+        while True:
+            item = self.compute_queue.get()
+            if item is self._STOP:
+                self.write_queue.put(self._STOP)
+                return
+
+            timeframe, compute, args, on_stored = item
+            try:
+                data = compute(*args)
+            except Exception as e:
+                print(f"Pipeline: computing {timeframe} indicators failed: {e}")
+                self.failed += 1
+                continue
+
+            self.computed += 1
+            if data is not None and not data.empty:
+                self.write_queue.put((timeframe, data, on_stored))
+
+    def _write_worker(self):
+        try:
+            with database_session(self.database_config) as conn:
+                self._write_loop(conn)
+        except Exception as e:
+            # Keep draining so the other stages never block on a dead writer
+            print(f"Pipeline: database session failed ({e}), writing with pooled connections")
+            self._write_loop()
+
+    def _write_loop(self, conn=None):
+        while not self._write_done:
+            item = self.write_queue.get()
+            if item is self._STOP:
+                self._write_done = True
+                return
+
+            timeframe, data, on_stored = item
+            try:
+                stored = store_marketdata(data, timeframe, self.database_config, self.storage_mode)
+            except Exception as e:
+                print(f"Pipeline: writing {timeframe} market data failed: {e}")
+                stored = False
+
+            if stored:
+                self.written += 1
+                if on_stored is not None:
+                    try:
+                        on_stored()
+                    except Exception as e:
+                        print(f"Pipeline: after storing {timeframe} market data: {e}")
+            else:
+                self.failed += 1
+                self._rollback(conn)
+
+    @staticmethod
+    def _rollback(conn):
+        """End a failed write's transaction so the session keeps working for the next item."""
+        if conn is None or conn.closed:
+            return
+        try:
+            conn.rollback()
+        except Exception as e:
+            print(f"Pipeline: rollback after a failed write failed: {e}")
+
+    def close(self):
+        """Drain both stages and wait for the last write."""
+        if not self._started:
+            return
+        self.compute_queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join()
+        self._started = False
+        print(
+            f"Pipeline: submitted={self.submitted} computed={self.computed} written={self.written} "
+            f"failed={self.failed} fetch_blocked={self.fetch_blocked_seconds:.1f}s"
+        )
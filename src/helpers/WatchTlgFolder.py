@@ -0,0 +1,124 @@
+import glob
+import json
+import os
+import time
+
+from helpers.ReadTlgFile import parse_account_info, parse_stk_trd_lines
+from helpers.HandleExecutions import store_executions
+
+
+def load_checkpoint(checkpoint_file):
+    """
+    Load persisted byte offsets {file_path: offset}.
+    Returns an empty dict if the checkpoint does not exist or is unreadable.
+    """
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return {}
+    try:
+        with open(checkpoint_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not read checkpoint {checkpoint_file}: {e}. Starting from the beginning.")
+        return {}
+
+
+def save_checkpoint(checkpoint_file, offsets):
+    """
+    Persist byte offsets atomically so a crash never leaves a half-written checkpoint.
+    """
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(offsets, f, indent=2)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def read_appended_lines(file_path, offset):
+    """
+    Read complete lines appended to file_path after the byte offset.
+    A trailing partial line is left for the next poll.
+    Returns (lines, new_offset).
+    """
+    size = os.path.getsize(file_path)
+    if size < offset:
+        # File was truncated or replaced, start over
+        print(f"{os.path.basename(file_path)} shrank below checkpoint, re-reading from start.")
+        offset = 0
+    if size == offset:
+        return [], offset
+
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+
+    last_newline = data.rfind(b"\n")
+    if last_newline == -1:
+        return [], offset
+
+    complete = data[:last_newline + 1]
+    lines = complete.decode('latin1').splitlines()
+    return lines, offset + len(complete)
+
+
+def watch_tlg_folder(project_config, database_config, process_batch, drain_jobs=None):
+    """
+    Daemon mode:
+    - Poll folders.in for .tlg files
+    - Tail each file from its persisted byte offset
+    - Parse only newly appended STK_TRD lines
+    - Insert executions and hand micro-batches to process_batch(executions_df, account_info)
+    - Call drain_jobs() at most every watch.fetch_interval_seconds, so market data
+      deferred until the session close is fetched without new executions
+    The checkpoint is advanced only after a batch has been processed.
+    """
+    watch_config = project_config.get('watch', {})
+    data_in_folder = project_config['folders']['in']
+    checkpoint_file = watch_config.get('checkpoint', os.path.join(data_in_folder, 'watch_checkpoint.json'))
+    poll_interval = float(watch_config.get('poll_interval_seconds', 5))
+    batch_size = int(watch_config.get('batch_size', 500))
+    fetch_interval = float(watch_config.get('fetch_interval_seconds', 300))
+    last_drain = time.monotonic()
+
+    offsets = load_checkpoint(checkpoint_file)
+    account_info = {}
+
+    print(f"Watching {data_in_folder} for new executions (poll every {poll_interval}s)...")
+
+    while True:
+        for file_path in sorted(glob.glob(f"{data_in_folder}/*.tlg")):
+            try:
+                lines, new_offset = read_appended_lines(file_path, offsets.get(file_path, 0))
+            except OSError as e:
+                print(f"Could not read {file_path}: {e}")
+                continue
+
+            if not lines:
+                continue
+
+            for line in lines:
+                if line.startswith("ACT_INF"):
+                    account_info = parse_account_info(line)
+
+            trade_lines = [line for line in lines if line.startswith("STK_TRD")]
+
+            try:
+                for start in range(0, len(trade_lines), batch_size):
+                    executions_df = parse_stk_trd_lines(trade_lines[start:start + batch_size])
+                    print(f"\n{len(executions_df)} new executions in {os.path.basename(file_path)}")
+                    store_executions(executions_df, database_config, project_config.get('timezones'))
+                    process_batch(executions_df, account_info)
+            except Exception as e:
+                # Keep the old offset so the lines are retried on the next poll
+                print(f"Error processing new executions from {file_path}: {e}")
+                continue
+
+            offsets[file_path] = new_offset
+            save_checkpoint(checkpoint_file, offsets)
+
+        if drain_jobs is not None and time.monotonic() - last_drain >= fetch_interval:
+            try:
+                drain_jobs()
+            except Exception as e:
+                print(f"Error draining fetch jobs: {e}")
+            last_drain = time.monotonic()
+
+        time.sleep(poll_interval)
@@ -0,0 +1,230 @@
+import atexit
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from tests import Generators
+
+
+# Benchmark cases: name -> setup(size) returning a zero-argument callable.
+# Setup (data generation) is not timed, only the returned callable is.
+
+SIZE_TIERS = {
+    "small": 1_000,
+    "medium": 10_000,
+    "large": 100_000,
+}
+
+
+def _scratch_folder():
+    """Temporary folder for generated files, removed when the run exits."""
+    folder = tempfile.mkdtemp(prefix="bench_tlg_")
+    atexit.register(shutil.rmtree, folder, ignore_errors=True)
+    return folder
+
+
+def _tlg_cases():
+    from helpers.ReadTlgFile import read_tlg_file, parse_tlg_file
+
+    def read_folder(size):
+        folder = _scratch_folder()
+        Generators.write_tlg_file(folder, size)
+        return lambda: read_tlg_file(folder)
+
+    def parse_file(size):
+        path = Generators.write_tlg_file(_scratch_folder(), size)
+        return lambda: parse_tlg_file(path)
+
+    return {"read_tlg_file": read_folder, "parse_tlg_file": parse_file}
+
+
+def _timezone_cases():
+    from common.AdjustTimezone import (
+        adjust_timezone_IB_data, adjust_timezone_transactions,
+        adjust_timezone_IB_series, adjust_timezone_transactions_frame
+    )
+
+    def ib_data(size):
+        dates = [str(d) for d in Generators.bar_frame(size)["date"]]
+        return lambda: [adjust_timezone_IB_data(d) for d in dates]
+
+    def transactions(size):
+        times = Generators.transactions_frame(size)["Time"].tolist()
+        return lambda: [adjust_timezone_transactions(t) for t in times]
+
+    def ib_series(size):
+        dates = Generators.bar_frame(size)["date"]
+        return lambda: adjust_timezone_IB_series(dates)
+
+    def transactions_frame(size):
+        df = Generators.transactions_frame(size)
+        return lambda: adjust_timezone_transactions_frame(df)
+
+    return {
+        "adjust_timezone_IB_data": ib_data,
+        "adjust_timezone_transactions": transactions,
+        "adjust_timezone_IB_series": ib_series,
+        "adjust_timezone_transactions_frame": transactions_frame,
+    }
+
+
+def _calculate_cases():
+    from common import Calculate
+
+    def frame_case(func):
+        def setup(size):
+            df = Generators.ohlcv_frame(size)
+            return lambda: func(df)
+        return setup
+
+    def relatr(size):
+        intraday = Calculate.calculate_vwap(Generators.ohlcv_frame(size))
+        atr = Calculate.calculate_14day_atr(Generators.ohlcv_frame(100, seed=1))
+        return lambda: Calculate.calculate_relatr(intraday, atr)
+
+    def kernel_case(func, *columns, extra=()):
+        def setup(size):
+            df = Generators.ohlcv_frame(size)
+            arrays = [df[col].to_numpy(dtype=float) for col in columns]
+            return lambda: func(*arrays, *extra)
+        return setup
+
+    return {
+        "calculate_vwap": frame_case(Calculate.calculate_vwap),
+        "calculate_ema": frame_case(lambda df: Calculate.calculate_ema(df, 9)),
+        "calculate_14day_atr": frame_case(Calculate.calculate_14day_atr),
+        "calculate_rvol": frame_case(Calculate.calculate_rvol),
+        "calculate_relatr": relatr,
+        "cumsum_skipna": kernel_case(Calculate.cumsum_skipna, "Volume"),
+        "vwap_kernel": kernel_case(Calculate.vwap_kernel, "Open", "High", "Low", "Close", "Volume"),
+        "ema_kernel": kernel_case(Calculate.ema_kernel, "Close", extra=(9,)),
+        "true_range_kernel": kernel_case(Calculate.true_range_kernel, "High", "Low", "Close"),
+        "rolling_mean_kernel": kernel_case(Calculate.rolling_mean_kernel, "Volume", extra=(5,)),
+    }
+
+
+def _handler_cases():
+    from helpers import HandleDataFrames as handlers
+
+    def single(func, bar_size):
+        def setup(size):
+            bars = Generators.bar_frame(size, bar_size)
+            return lambda: func(bars, "SYN", 1)
+        return setup
+
+    def batch(func, bar_size):
+        def setup(size):
+            bars = Generators.long_bar_frame(size, bar_size)
+            return lambda: func(bars)
+        return setup
+
+    return {
+        "handle_incoming_dataframe_daily": single(handlers.handle_incoming_dataframe_daily, "1 day"),
+        "handle_incoming_dataframe_midterm": single(handlers.handle_incoming_dataframe_midterm, "30 mins"),
+        "handle_incoming_dataframe_intraday": single(handlers.handle_incoming_dataframe_intraday, "2 mins"),
+        "handle_incoming_dataframe_atr": single(handlers.handle_incoming_dataframe_atr, "1 day"),
+        "handle_incoming_dataframes_daily_batch": batch(handlers.handle_incoming_dataframes_daily_batch, "1 day"),
+        "handle_incoming_dataframes_midterm_batch": batch(handlers.handle_incoming_dataframes_midterm_batch, "30 mins"),
+        "handle_incoming_dataframes_intraday_batch": batch(handlers.handle_incoming_dataframes_intraday_batch, "2 mins"),
+        "handle_incoming_dataframes_atr_batch": batch(handlers.handle_incoming_dataframes_atr_batch, "1 day"),
+    }
+
+
+GROUPS = {
+    "tlg": _tlg_cases,
+    "timezone": _timezone_cases,
+    "calculate": _calculate_cases,
+    "handlers": _handler_cases,
+}
+
+
+def load_cases(groups=None):
+    """
+    Import the benchmark groups. A group whose modules cannot be imported
+    (e.g. handlers without psycopg2 installed) is reported and skipped.
+    Returns ({name: setup}, {group: reason}).
+    """
+    cases, skipped = {}, {}
+    for group, loader in GROUPS.items():
+        if groups and group not in groups:
+            continue
+        try:
+            cases.update({f"{group}.{name}": setup for name, setup in loader().items()})
+        except ImportError as e:
+            skipped[group] = str(e)
+    return cases, skipped
+
+
+def time_case(func, repeat=5):
+    """Run func `repeat` times (after one warm-up call) and return timings in seconds."""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(tiers=("small", "medium"), groups=None, repeat=5, pattern=None):
+    """Run every case on every tier. Returns the results document."""
+    cases, skipped = load_cases(groups)
+    for group, reason in skipped.items():
+        print(f"Skipping {group} benchmarks: {reason}")
+
+    results = {}
+    for tier in tiers:
+        size = SIZE_TIERS[tier]
+        for name, setup in cases.items():
+            if pattern and pattern not in name:
+                continue
+            key = f"{name}@{tier}"
+            try:
+                timings = time_case(setup(size), repeat)
+            except Exception as e:
+                print(f"{key}: failed ({e})")
+                continue
+            results[key] = {
+                "rows": size,
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "rows_per_second": size / statistics.median(timings) if statistics.median(timings) else 0.0
+            }
+            print(f"{key:<70}{results[key]['median'] * 1000:>12.3f} ms")
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """
+    Compare medians against a baseline document.
+    Returns (regressions, improvements) as lists of (key, ratio).
+    """
+    regressions, improvements = [], []
+    for key, result in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base or not base["median"]:
+            continue
+        ratio = result["median"] / base["median"]
+        if ratio > 1 + threshold:
+            regressions.append((key, ratio))
+        elif ratio < 1 - threshold:
+            improvements.append((key, ratio))
+    return regressions, improvements
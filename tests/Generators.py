@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Deterministic synthetic inputs for the benchmarks.
+# Same seed and size always give the same data.
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "TSLA", "AMD", "META", "AMZN", "GOOGL", "SPY", "QQQ"]
+VENUES = ["ARCA", "NASDAQ", "NYSE", "ISLAND", "BATS"]
+ACTIONS = ["BUYTOOPEN", "SELLTOCLOSE", "SELLTOOPEN", "BUYTOCLOSE"]
+
+
+def tlg_lines(n_trades, seed=0, start_date="2024-01-02"):
+    """STK_TRD lines in IB trade log layout, spread over business days and the extended session."""
+    rng = np.random.default_rng(seed)
+    symbols = rng.choice(SYMBOLS, n_trades)
+    venues = rng.choice(VENUES, n_trades)
+    actions = rng.choice(ACTIONS, n_trades)
+    days = pd.bdate_range(start_date, periods=max(1, n_trades // 20 + 1))
+    dates = days[np.sort(rng.integers(0, len(days), n_trades))].strftime("%Y%m%d")
+    seconds = rng.integers(4 * 3600, 20 * 3600, n_trades)
+    quantities = rng.integers(1, 50, n_trades) * 10
+    prices = np.round(rng.uniform(5, 500, n_trades), 2)
+    fees = np.round(-rng.uniform(0.35, 3.0, n_trades), 4)
+
+    lines = []
+    for i in range(n_trades):
+        hours, rest = divmod(int(seconds[i]), 3600)
+        minutes, secs = divmod(rest, 60)
+        signed = quantities[i] if actions[i].startswith("BUY") else -quantities[i]
+        lines.append("|".join([
+            "STK_TRD", str(400000000 + i), symbols[i], f"{symbols[i]} INC", venues[i], actions[i],
+            "O" if actions[i].endswith("OPEN") else "C", dates[i], f"{hours:02d}:{minutes:02d}:{secs:02d}",
+            "USD", f"{signed:.0f}", "1.00", f"{prices[i]:.2f}", f"{-signed * prices[i]:.2f}", f"{fees[i]:.4f}", ""
+        ]))
+    return lines
+
+
+def write_tlg_file(folder, n_trades, seed=0, filename="synthetic.tlg"):
+    """Write a complete .tlg file (account + transactions sections) and return its path."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, filename)
+    with open(path, 'w', encoding='latin1') as f:
+        f.write("ACCOUNT_INFORMATION\n")
+        f.write("ACT_INF|U0000000|Synthetic Trader|Individual|Helsinki, Finland\n\n")
+        f.write("STOCK_TRANSACTIONS\n")
+        f.write("\n".join(tlg_lines(n_trades, seed)))
+        f.write("\n")
+    return path
+
+
+def transactions_frame(n_trades, seed=0):
+    """Parsed-executions style frame (Date YYYYMMDD, Time HH:MM:SS strings)."""
+    rows = [line.split("|") for line in tlg_lines(n_trades, seed)]
+    df = pd.DataFrame(rows, columns=[
+        "Record", "TransactionID", "Ticker", "CompanyName", "Venue", "Action",
+        "OrderType", "Date", "Time", "Currency", "Quantity", "Multiplier",
+        "Price", "Amount", "Fee", "Extra"
+    ]).drop(columns=["Record"])
+    return df.astype({"Quantity": float, "Price": float, "Fee": float, "Amount": float})
+
+
+def bar_frame(n_bars, bar_size="2 mins", seed=0, start="2024-01-02 04:00"):
+    """
+    IB bars as returned by ib_insync (date, open, high, low, close, volume, average, barCount).
+    Intraday bars carry tz-aware exchange timestamps, daily bars plain dates.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.5, n_bars))
+    open_ = close + rng.normal(0, 0.2, n_bars)
+    high = np.maximum(open_, close) + rng.uniform(0, 0.5, n_bars)
+    low = np.minimum(open_, close) - rng.uniform(0, 0.5, n_bars)
+    volume = rng.integers(100, 100000, n_bars)
+
+    if bar_size == "1 day":
+        dates = list(pd.bdate_range(start[:10], periods=n_bars).date)
+    else:
+        minutes = int(bar_size.split()[0])
+        dates = list(pd.date_range(start, periods=n_bars, freq=f"{minutes}min", tz="US/Eastern").to_pydatetime())
+
+    return pd.DataFrame({
+        "date": dates,
+        "open": np.round(open_, 2),
+        "high": np.round(high, 2),
+        "low": np.round(low, 2),
+        "close": np.round(close, 2),
+        "volume": volume,
+        "average": np.round((open_ + high + low + close) / 4, 2),
+        "barCount": rng.integers(1, 500, n_bars)
+    })
+
+
+def ohlcv_frame(n_bars, seed=0):
+    """Capitalized OHLCV frame, the input of common/Calculate.py."""
+    bars = bar_frame(n_bars, "1 day", seed)
+    return bars.rename(columns={col: col.capitalize() for col in bars.columns}).assign(Symbol="SYN")
+
+
+def long_bar_frame(n_bars, bar_size="2 mins", trades=10, seed=0):
+    """Long-format bars for the batch handlers: n_bars split over `trades` TradeIds."""
+    per_trade = max(1, n_bars // trades)
+    frames = [
+        bar_frame(per_trade, bar_size, seed + trade_id).assign(
+            Symbol=SYMBOLS[trade_id % len(SYMBOLS)], TradeId=trade_id + 1
+        )
+        for trade_id in range(trades)
+    ]
+    return pd.concat(frames, ignore_index=True)
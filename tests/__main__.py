@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sys
+
+# Benchmarks import the application modules the same way Main.py does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
+
+from tests.Benchmarks import SIZE_TIERS, GROUPS, run, compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, timezone, indicator and handler code")
+    parser.add_argument("--tiers", default="small,medium",
+                        help=f"Comma separated size tiers ({', '.join(SIZE_TIERS)})")
+    parser.add_argument("--groups", default=None,
+                        help=f"Comma separated benchmark groups ({', '.join(GROUPS)}), all by default")
+    parser.add_argument("-k", dest="pattern", default=None, help="Only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results JSON")
+    parser.add_argument("--baseline", default=None, help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative median change reported as regression/improvement")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 when a case regressed beyond the threshold")
+    args = parser.parse_args()
+
+    tiers = [tier.strip() for tier in args.tiers.split(",") if tier.strip()]
+    groups = [group.strip() for group in args.groups.split(",")] if args.groups else None
+
+    current = run(tiers=tiers, groups=groups, repeat=args.repeat, pattern=args.pattern)
+
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions, improvements = compare(current, baseline, args.threshold)
+
+    print(f"\nCompared with {args.baseline} (threshold {args.threshold:.0%}):")
+    for key, ratio in improvements:
+        print(f"  faster  {key:<70}{ratio:>8.2f}x")
+    for key, ratio in regressions:
+        print(f"  SLOWER  {key:<70}{ratio:>8.2f}x")
+    if not regressions and not improvements:
+        print("  no changes beyond the threshold")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())